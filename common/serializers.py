@@ -0,0 +1,85 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_QUERY_PARAM = "fields"
+OMIT_QUERY_PARAM = "omit"
+
+
+def _split(value):
+    return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Let clients choose the top-level fields of a read with ``?fields=a,b`` or
+    drop some with ``?omit=a,b``.
+
+    ``restrict_queryset`` trims the SQL to match. By default a field needs the
+    model column of the same name; fields that need something else declare it:
+
+    - ``sparse_columns``: field name -> columns to load with ``.only()``.
+    - ``sparse_select_related``: field name -> relations to join.
+    - ``sparse_prefetch_related``: field name -> relations to prefetch.
+    """
+
+    sparse_columns = {}
+    sparse_select_related = {}
+    sparse_prefetch_related = {}
+
+    @classmethod
+    def get_sparse_field_names(cls, request):
+        """
+        The field names to render, or ``None`` when the client didn't restrict
+        them.
+        """
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+
+        fields = _split(request.query_params.get(FIELDS_QUERY_PARAM))
+        omit = _split(request.query_params.get(OMIT_QUERY_PARAM))
+        if not fields and not omit:
+            return None
+
+        unknown = (fields | omit) - set(cls.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError(
+                {FIELDS_QUERY_PARAM: f"Unknown fields: {', '.join(sorted(unknown))}."}
+            )
+        return [
+            name
+            for name in cls.Meta.fields
+            if (not fields or name in fields) and name not in omit
+        ]
+
+    @classmethod
+    def restrict_queryset(cls, queryset, request):
+        names = cls.get_sparse_field_names(request)
+        if names is None:
+            return queryset
+
+        columns = {cls.Meta.model._meta.pk.name}
+        select_related, prefetch_related = set(), set()
+        for name in names:
+            columns.update(cls.sparse_columns.get(name, (name,)))
+            select_related.update(cls.sparse_select_related.get(name, ()))
+            prefetch_related.update(cls.sparse_prefetch_related.get(name, ()))
+
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        return queryset.prefetch_related(*prefetch_related).only(*columns)
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        # Only the endpoint's own resource is trimmed, never nested ones.
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+
+        names = self.get_sparse_field_names(self.context.get("request"))
+        if names is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in names}
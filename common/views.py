@@ -0,0 +1,14 @@
+from rest_framework.permissions import SAFE_METHODS
+
+
+class SparseFieldsQuerySetMixin:
+    """
+    Trim reads to the fields requested with ``?fields=``/``?omit=``; the
+    serializer class must use ``SparseFieldsMixin``.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return self.get_serializer_class().restrict_queryset(queryset, self.request)
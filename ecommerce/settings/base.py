@@ -98,6 +98,22 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
 }
 
+CATALOG_CACHE_TIMEOUT = 60 * 15
+PRODUCT_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+PRODUCT_CARD_MISSING_TIMEOUT = 60
+
+# Seconds after which an image variant worker's claim is considered abandoned.
+IMAGE_VARIANTS_CLAIM_TIMEOUT = 60 * 30
+
+# Unique per worker process (0-1023); derived from host and pid when unset.
+ORDER_NUMBER_WORKER_ID = os.getenv("ORDER_NUMBER_WORKER_ID")
+
+# "database" keeps carts in CartItem rows; "redis" keeps them in Redis hashes
+# that `manage.py persist_carts` and checkout copy to CartItem.
+CART_BACKEND = os.getenv("CART_BACKEND", "database")
+CART_REDIS_URL = os.getenv("CART_REDIS_URL", "redis://localhost:6379/2")
+CART_SESSION_TIMEOUT = 60 * 60 * 24 * 7
+
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
@@ -26,3 +26,7 @@ CACHES = {
         },
     }
 }
+
+CART_REDIS_URL = os.getenv(
+    "CART_REDIS_URL", "redis://{}:{}/2".format(REDIS_HOST, REDIS_PORT)
+)
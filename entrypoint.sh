@@ -1,4 +1,11 @@
 #!/bin/sh
 export DJANGO_SETTINGS_MODULE=ecommerce.settings.prod
 python manage.py migrate
-gunicorn ecommerce.wsgi:application --bind 0.0.0.0:8000
\ No newline at end of file
+
+# SERVER_MODE=asgi serves the app (including the async catalog endpoints under
+# /api/v1/async/) from uvicorn workers instead of synchronous WSGI workers.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn ecommerce.asgi:application --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
+else
+    gunicorn ecommerce.wsgi:application --bind 0.0.0.0:8000
+fi
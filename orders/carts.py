@@ -0,0 +1,50 @@
+"""
+Set-based cart writes.
+
+A whole batch of cart lines is written with one ``INSERT ... ON CONFLICT
+(user, product) DO UPDATE`` on the cart's unique constraint plus at most one
+``DELETE``, instead of a lookup and a save per line.
+"""
+
+from django.db import transaction
+from .models import CartItem
+
+MAX_CART_LINES = 100
+
+
+def update_cart(user, quantities, replace=False):
+    """
+    Apply ``{product_id: quantity}`` to the user's cart; a zero quantity
+    removes the line. With ``replace``, lines for other products are removed
+    as well, so the cart ends up holding exactly ``quantities``.
+    """
+    kept = [product_id for product_id, quantity in quantities.items() if quantity]
+    removed = [product_id for product_id, quantity in quantities.items() if not quantity]
+
+    with transaction.atomic():
+        if kept:
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(user=user, product_id=product_id, quantity=quantities[product_id])
+                    for product_id in kept
+                ],
+                update_conflicts=True,
+                unique_fields=["user", "product"],
+                update_fields=["quantity", "updated_at"],
+            )
+        if replace:
+            CartItem.objects.filter(user=user).exclude(product_id__in=kept).delete()
+        elif removed:
+            CartItem.objects.filter(user=user, product_id__in=removed).delete()
+
+
+def get_cart_lines(user):
+    """
+    The user's cart with just what a cart summary needs from each product.
+    """
+    return (
+        CartItem.objects.filter(user=user)
+        .select_related("product")
+        .only("quantity", "created_at", "product__price", "product__in_stock")
+        .order_by("-created_at")
+    )
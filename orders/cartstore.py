@@ -0,0 +1,331 @@
+"""
+Redis cart store with write-behind persistence.
+
+With ``CART_BACKEND = "redis"`` carts live in one Redis hash per owner
+(``cart:user:<id>`` or, for anonymous visitors, ``cart:session:<key>``)
+holding ``q:<product>`` (quantity), ``c:<product>`` and ``u:<product>``
+(created and updated times, in milliseconds). Every cart operation is one or
+two Redis round trips; product data comes from the product card cache.
+
+Writes to a user's cart add the owner to the ``cart:dirty`` set, and
+``persist_carts`` (or checkout, for the cart being ordered) copies dirty carts
+to ``CartItem`` rows; ``persist_carts --load`` seeds the store from them.
+Anonymous carts only live in Redis and expire after
+``CART_SESSION_TIMEOUT`` seconds of inactivity; when the visitor signs in,
+the first cart request merges theirs into the account's cart. Line ids are
+product ids.
+
+Between ``persist_carts`` passes Redis holds the only copy of a cart change.
+Using a database of its own doesn't shield carts from eviction: the
+``maxmemory-policy`` applies to the whole instance, so the instance holding
+carts must run with ``noeviction`` (or be a separate one), and with
+``appendonly yes`` so a restart doesn't lose the changes made since the last
+pass, as in ``docker-compose.yml``.
+"""
+
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+import redis
+from django.conf import settings
+from rest_framework import serializers
+from products.cards import get_cards, with_absolute_urls
+from products.models import Product
+from users.models import CustomUser as User
+from .carts import update_cart
+from .models import CartItem
+
+KEY = "cart:{}"
+DIRTY_KEY = "cart:dirty"
+USER_OWNER = "user:{}"
+SESSION_OWNER = "session:{}"
+
+logger = logging.getLogger(__name__)
+
+_datetime_field = serializers.DateTimeField()
+
+
+def owner_key(request, create=False):
+    """
+    The cart owner of a request, or ``None`` for an anonymous visitor without
+    a cart unless ``create`` starts one.
+    """
+    session = request.session
+    if request.user.is_authenticated:
+        owner = USER_OWNER.format(request.user.pk)
+        cart = session.get("cart")
+        if cart is not None:
+            # Filled in before signing in.
+            get_cart_store().merge(SESSION_OWNER.format(cart), owner)
+            del session["cart"]
+        return owner
+
+    if "cart" not in session:
+        if not create:
+            return None
+        if session.session_key is None:
+            session.save()
+        # Remembered in the session rather than derived from its key, which
+        # changes when the visitor signs in.
+        session["cart"] = session.session_key
+    return SESSION_OWNER.format(session["cart"])
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def _datetime(ms):
+    return _datetime_field.to_representation(
+        datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc)
+    )
+
+
+class RedisCartStore:
+    def __init__(self, client):
+        self.client = client
+
+    def _touch(self, pipe, owner):
+        if owner.startswith(USER_OWNER.format("")):
+            pipe.sadd(DIRTY_KEY, owner)
+        else:
+            pipe.expire(KEY.format(owner), settings.CART_SESSION_TIMEOUT)
+
+    def get_lines(self, owner):
+        """
+        ``{"product", "quantity", "created_at", "updated_at"}`` dicts, newest
+        first.
+        """
+        fields = {
+            name.decode(): int(value)
+            for name, value in self.client.hgetall(KEY.format(owner)).items()
+        }
+        lines = []
+        for name, quantity in fields.items():
+            kind, _, product_id = name.partition(":")
+            if kind != "q":
+                continue
+            updated = fields.get(f"u:{product_id}", 0)
+            lines.append(
+                {
+                    "product": int(product_id),
+                    "quantity": quantity,
+                    "created_at": fields.get(f"c:{product_id}", updated),
+                    "updated_at": updated,
+                }
+            )
+        lines.sort(key=lambda line: (line["created_at"], line["product"]), reverse=True)
+        return lines
+
+    def add(self, owner, product_id, quantity):
+        """
+        Add a line; ``False`` if the product is already in the cart.
+        """
+        key, now = KEY.format(owner), _now()
+        with self.client.pipeline() as pipe:
+            pipe.hsetnx(key, f"q:{product_id}", quantity)
+            pipe.hsetnx(key, f"c:{product_id}", now)
+            pipe.hsetnx(key, f"u:{product_id}", now)
+            self._touch(pipe, owner)
+            added = pipe.execute()[0]
+        return bool(added)
+
+    def set_quantity(self, owner, product_id, quantity):
+        """
+        Change a line's quantity; ``False`` if the product isn't in the cart.
+        """
+        key = KEY.format(owner)
+        if not self.client.hexists(key, f"q:{product_id}"):
+            return False
+        with self.client.pipeline() as pipe:
+            pipe.hset(
+                key, mapping={f"q:{product_id}": quantity, f"u:{product_id}": _now()}
+            )
+            self._touch(pipe, owner)
+            pipe.execute()
+        return True
+
+    def remove(self, owner, product_ids):
+        """
+        Remove lines; returns how many were in the cart.
+        """
+        if not product_ids:
+            return 0
+        key = KEY.format(owner)
+        with self.client.pipeline() as pipe:
+            for product_id in product_ids:
+                pipe.hdel(key, f"q:{product_id}", f"c:{product_id}", f"u:{product_id}")
+            self._touch(pipe, owner)
+            removed = pipe.execute()[: len(product_ids)]
+        return sum(1 for count in removed if count)
+
+    def update(self, owner, quantities, replace=False):
+        """
+        Same semantics as ``carts.update_cart``.
+        """
+        key, now = KEY.format(owner), _now()
+        kept = [product_id for product_id, quantity in quantities.items() if quantity]
+        removed = [
+            product_id for product_id, quantity in quantities.items() if not quantity
+        ]
+        if replace:
+            removed = [
+                line["product"]
+                for line in self.get_lines(owner)
+                if line["product"] not in kept
+            ]
+
+        with self.client.pipeline() as pipe:
+            for product_id in removed:
+                pipe.hdel(key, f"q:{product_id}", f"c:{product_id}", f"u:{product_id}")
+            if kept:
+                mapping = {}
+                for product_id in kept:
+                    mapping[f"q:{product_id}"] = quantities[product_id]
+                    mapping[f"u:{product_id}"] = now
+                pipe.hset(key, mapping=mapping)
+                for product_id in kept:
+                    pipe.hsetnx(key, f"c:{product_id}", now)
+            self._touch(pipe, owner)
+            pipe.execute()
+
+    def merge(self, source, owner):
+        """
+        Move the lines of the ``source`` cart into ``owner``'s and delete it.
+        Products ``owner`` already has keep their line.
+        """
+        lines = self.get_lines(source)
+        key = KEY.format(owner)
+        with self.client.pipeline() as pipe:
+            for line in lines:
+                product_id = line["product"]
+                pipe.hsetnx(key, f"q:{product_id}", line["quantity"])
+                pipe.hsetnx(key, f"c:{product_id}", line["created_at"])
+                pipe.hsetnx(key, f"u:{product_id}", line["updated_at"])
+            pipe.delete(KEY.format(source))
+            if lines:
+                self._touch(pipe, owner)
+            pipe.execute()
+
+    def persist(self, owner):
+        """
+        Copy a user's cart to ``CartItem`` rows, replacing what is there. The
+        cart of a user who no longer exists is dropped.
+        """
+        user_id = int(owner.partition(":")[2])
+        # Unmark first: a write that lands meanwhile marks the cart again.
+        self.client.srem(DIRTY_KEY, owner)
+        try:
+            if not User.objects.filter(pk=user_id).exists():
+                self.client.delete(KEY.format(owner))
+                return
+            quantities = {
+                line["product"]: line["quantity"] for line in self.get_lines(owner)
+            }
+            # Products deleted since they were added are dropped.
+            existing = set(
+                Product.objects.filter(pk__in=quantities).values_list("pk", flat=True)
+            )
+            update_cart(
+                User(pk=user_id),
+                {pk: quantity for pk, quantity in quantities.items() if pk in existing},
+                replace=True,
+            )
+        except Exception:
+            self.client.sadd(DIRTY_KEY, owner)
+            raise
+
+    def load(self, queryset=None):
+        """
+        Copy ``CartItem`` rows into the store, e.g. when switching an existing
+        deployment to it; returns how many lines were loaded.
+        """
+        if queryset is None:
+            queryset = CartItem.objects.all()
+        rows = queryset.values_list(
+            "user_id", "product_id", "quantity", "created_at", "updated_at"
+        ).iterator()
+
+        count = 0
+        with self.client.pipeline(transaction=False) as pipe:
+            for user_id, product_id, quantity, created_at, updated_at in rows:
+                pipe.hset(
+                    KEY.format(USER_OWNER.format(user_id)),
+                    mapping={
+                        f"q:{product_id}": quantity,
+                        f"c:{product_id}": int(created_at.timestamp() * 1000),
+                        f"u:{product_id}": int(updated_at.timestamp() * 1000),
+                    },
+                )
+                count += 1
+                if count % 1000 == 0:
+                    pipe.execute()
+            pipe.execute()
+        return count
+
+    def dirty_count(self):
+        return self.client.scard(DIRTY_KEY)
+
+    def persist_dirty(self, batch_size=100):
+        """
+        Persist up to ``batch_size`` dirty user carts; returns how many were
+        taken. A cart that fails is logged and stays dirty for the next pass,
+        without holding up the rest of the batch.
+        """
+        owners = self.client.spop(DIRTY_KEY, batch_size) or []
+        for owner in owners:
+            try:
+                self.persist(owner.decode())
+            except Exception:
+                logger.exception("Cannot persist cart %s", owner.decode())
+        return len(owners)
+
+
+def render_lines(request, lines):
+    """
+    Store lines in the same shape as ``CartItemSerializer``, honouring
+    ``?fields=``/``?omit=``. Lines whose product is gone are left out.
+    """
+    from .serializers import CartItemSerializer
+
+    cards = get_cards([line["product"] for line in lines])
+    user_id = request.user.pk if request.user.is_authenticated else None
+    names = CartItemSerializer.get_sparse_field_names(request)
+
+    data = []
+    for line in lines:
+        card = cards.get(line["product"])
+        if card is None:
+            continue
+        item = {
+            "id": line["product"],
+            "user": user_id,
+            "product": line["product"],
+            "product_detail": with_absolute_urls(card, request),
+            "quantity": line["quantity"],
+            "is_unavailable": card["in_stock"] <= line["quantity"],
+            "total_price": Decimal(card["price"]) * line["quantity"],
+            "created_at": _datetime(line["created_at"]),
+            "updated_at": _datetime(line["updated_at"]),
+        }
+        if names is not None:
+            item = {name: item[name] for name in names}
+        data.append(item)
+    return data
+
+
+_store = None
+
+
+def get_cart_store():
+    """
+    The Redis cart store, or ``None`` when carts are kept in the database.
+    """
+    global _store
+
+    if settings.CART_BACKEND != "redis":
+        return None
+    if _store is None:
+        _store = RedisCartStore(redis.Redis.from_url(settings.CART_REDIS_URL))
+    return _store
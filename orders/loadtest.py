@@ -0,0 +1,73 @@
+"""
+Concurrent checkout benchmark on a single hot product.
+
+``workers`` threads, each with its own database connection, reserve stock of
+one product in a closed loop for ``duration`` seconds. ``conditional`` uses
+``reserve_stock``; ``locking`` is the naive ``SELECT ... FOR UPDATE`` then
+``save`` it replaces, for comparison.
+"""
+
+import threading
+import time
+from django.db import DatabaseError, connection, transaction
+from products.loadtest import LoadResult
+from products.models import Product
+from .stock import InsufficientStock, reserve_stock
+
+MODES = ("conditional", "locking")
+
+
+class ReservationResult(LoadResult):
+    def __init__(self, latencies, reserved, sold_out, errors, elapsed):
+        super().__init__(None, latencies, errors, elapsed)
+        self.reserved = reserved
+        self.sold_out = sold_out
+
+
+def reserve_locking(product_id, quantity):
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        if product.in_stock < quantity:
+            raise InsufficientStock([])
+        product.in_stock -= quantity
+        product.save(update_fields=["in_stock", "updated_at"])
+
+
+def run_reservations(product_id, workers=16, duration=10.0, quantity=1, mode="conditional"):
+    if mode == "locking":
+        reserve = lambda: reserve_locking(product_id, quantity)  # noqa: E731
+    else:
+        reserve = lambda: reserve_stock([(product_id, quantity)])  # noqa: E731
+
+    latencies = []
+    counts = {"reserved": 0, "sold_out": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        own_latencies, own = [], dict.fromkeys(counts, 0)
+        try:
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                try:
+                    reserve()
+                    own["reserved"] += 1
+                except InsufficientStock:
+                    own["sold_out"] += 1
+                except DatabaseError:
+                    own["errors"] += 1
+                own_latencies.append(time.monotonic() - started)
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            for key, value in own.items():
+                counts[key] += value
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return ReservationResult(latencies, elapsed=time.monotonic() - started, **counts)
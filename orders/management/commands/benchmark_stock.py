@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.loadtest import MODES, run_reservations
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks concurrent stock reservations on a single hot product and "
+        "checks that nothing was oversold"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("product", type=int, help="Id of the product to reserve")
+        parser.add_argument(
+            "--stock", type=int, help="Reset the product's stock before the run"
+        )
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per mode")
+        parser.add_argument("--quantity", type=int, default=1)
+        parser.add_argument("--mode", choices=MODES, action="append")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["quantity"] < 1:
+            raise CommandError("--workers and --quantity must be positive.")
+        products = Product.objects.filter(pk=options["product"])
+        if not products.exists():
+            raise CommandError(f"Unknown product: {options['product']}")
+
+        self.stdout.write(
+            f"{'mode':<12} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'reserved':>9} {'sold out':>9} {'errors':>7} {'stock':>7}"
+        )
+        for mode in options["mode"] or MODES:
+            if options["stock"] is not None:
+                products.update(in_stock=options["stock"])
+            before = products.values_list("in_stock", flat=True).get()
+
+            result = run_reservations(
+                options["product"],
+                workers=options["workers"],
+                duration=options["duration"],
+                quantity=options["quantity"],
+                mode=mode,
+            )
+
+            after = products.values_list("in_stock", flat=True).get()
+            self.stdout.write(
+                f"{mode:<12} {result.rate:9.1f} {result.percentile(50) * 1000:8.1f} "
+                f"{result.percentile(99) * 1000:8.1f} {result.reserved:9d} "
+                f"{result.sold_out:9d} {result.errors:7d} {after:7d}"
+            )
+            if before - result.reserved * options["quantity"] != after:
+                raise CommandError(
+                    f"Stock mismatch in {mode} mode: {before} - "
+                    f"{result.reserved} x {options['quantity']} != {after}"
+                )
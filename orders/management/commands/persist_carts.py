@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from orders.cartstore import get_cart_store
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies carts changed in the Redis cart store to the database; run it "
+        "periodically, or with --interval as a long-running worker"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running, persisting changed carts every this many seconds",
+        )
+        parser.add_argument(
+            "--load",
+            action="store_true",
+            help="Instead, seed the store from the database (when switching to it)",
+        )
+
+    def handle(self, *args, **options):
+        store = get_cart_store()
+        if store is None:
+            raise CommandError('CART_BACKEND is not "redis".')
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        if options["load"]:
+            count = store.load()
+            self.stdout.write(self.style.SUCCESS(f"Loaded {count} cart lines."))
+            return
+
+        if options["interval"] is None:
+            self.persist(store, options["batch_size"])
+            return
+
+        while True:
+            close_old_connections()
+            try:
+                self.persist(store, options["batch_size"])
+            except Exception as e:
+                # Redis or the database being briefly unreachable shouldn't
+                # stop the worker; the carts are still dirty next time.
+                self.stderr.write(f"Cannot persist carts: {e}")
+            time.sleep(options["interval"])
+
+    def persist(self, store, batch_size):
+        # Carts that fail go back to the dirty set; only drain what was there
+        # at the start, so they aren't retried over and over in one pass.
+        remaining, persisted = store.dirty_count(), 0
+        while remaining > 0:
+            count = store.persist_dirty(min(batch_size, remaining))
+            if not count:
+                break
+            persisted += count
+            remaining -= count
+        self.stdout.write(f"Persisted {persisted} carts.")
@@ -2,8 +2,7 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from users.models import CustomUser as User
 from products.models import Product
-import string
-import random
+from .numbering import next_order_number
 
 
 class CartItem(models.Model):
@@ -53,22 +52,18 @@ class Order(models.Model):
     shipping_address = models.ForeignKey(
         "ShippingAddress", on_delete=models.SET_NULL, null=True
     )
+    # Whether the order holds stock taken at checkout (see ``orders.stock``);
+    # orders placed before reservations existed never did.
+    stock_reserved = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Order {self.order_number} by {self.user.username}"
 
-    def generate_random_string(self, length):
-        chars = list(string.ascii_lowercase + string.digits)
-        return "".join(random.choice(chars) for _ in range(length))
-
     def save(self, *args, **kwargs):
         if not self.order_number:
-            while True:
-                self.order_number = self.generate_random_string(9)
-                if not Order.objects.filter(order_number=self.order_number).exists():
-                    break
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
 
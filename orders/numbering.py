@@ -0,0 +1,121 @@
+"""
+Order numbers generated in-process, without touching the database.
+
+A number packs, most significant first, the milliseconds since ``EPOCH``, the
+worker id, a per-worker sequence within the millisecond and random bits, and
+encodes them in lowercase Crockford base32 at a fixed length. Numbers from
+different workers can't collide as long as worker ids differ (and only with
+negligible probability when they don't, thanks to the random bits), numbers
+sort by creation time as plain strings, and the random bits keep neighbouring
+numbers unguessable. Older 9-character numbers stay valid; new ones are longer,
+so they never clash.
+"""
+
+import os
+import secrets
+import socket
+import threading
+import time
+import zlib
+from django.conf import settings
+
+ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+
+TIMESTAMP_BITS = 42
+WORKER_BITS = 10
+SEQUENCE_BITS = 8
+RANDOM_BITS = 30
+LENGTH = (TIMESTAMP_BITS + WORKER_BITS + SEQUENCE_BITS + RANDOM_BITS) // 5
+
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+def encode(value, length=LENGTH):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def decode(number):
+    value = 0
+    for char in number:
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+def default_worker_id():
+    """
+    ``ORDER_NUMBER_WORKER_ID`` if set, else derived from the host and process.
+    """
+    worker_id = getattr(settings, "ORDER_NUMBER_WORKER_ID", None)
+    if worker_id not in (None, ""):
+        return int(worker_id) & MAX_WORKER_ID
+    key = f"{socket.gethostname()}:{os.getpid()}".encode()
+    return zlib.crc32(key) & MAX_WORKER_ID
+
+
+class OrderNumberGenerator:
+    def __init__(self, worker_id, clock=time.time):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be between 0 and {MAX_WORKER_ID}")
+        self.worker_id = worker_id
+        self.clock = clock
+        self.last = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def tick(self):
+        """
+        Next ``(timestamp, sequence)``; never repeats and never goes back.
+        """
+        with self.lock:
+            now = int((self.clock() - EPOCH) * 1000)
+            if now > self.last:
+                self.last, self.sequence = now, 0
+            elif self.sequence < MAX_SEQUENCE:
+                self.sequence += 1
+            else:
+                # Sequence exhausted (or the clock stepped back): borrow the
+                # next millisecond rather than wait for it.
+                self.last, self.sequence = self.last + 1, 0
+            return self.last, self.sequence
+
+    def __call__(self):
+        timestamp, sequence = self.tick()
+        value = timestamp
+        value = (value << WORKER_BITS) | self.worker_id
+        value = (value << SEQUENCE_BITS) | sequence
+        value = (value << RANDOM_BITS) | secrets.randbits(RANDOM_BITS)
+        return encode(value)
+
+
+def number_timestamp(number):
+    """
+    Creation time (Unix seconds) of a generated order number, or ``None`` for
+    numbers from the old scheme.
+    """
+    if len(number) != LENGTH:
+        return None
+    shift = WORKER_BITS + SEQUENCE_BITS + RANDOM_BITS
+    return (decode(number) >> shift) / 1000 + EPOCH
+
+
+_generator = None
+_generator_pid = None
+_lock = threading.Lock()
+
+
+def next_order_number():
+    global _generator, _generator_pid
+
+    # A forked worker must not share its parent's sequence or worker id.
+    if _generator is None or _generator_pid != os.getpid():
+        with _lock:
+            if _generator is None or _generator_pid != os.getpid():
+                _generator = OrderNumberGenerator(default_worker_id())
+                _generator_pid = os.getpid()
+    return _generator()
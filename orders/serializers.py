@@ -1,12 +1,15 @@
 from rest_framework import serializers
 from django.db import transaction
-from products.serializers import ProductSerializer
+from django.db.models import Q
+from common.serializers import SparseFieldsMixin
+from products.cards import ProductCardBatchListSerializer, ProductCardField
 from products.models import Product
 from .models import CartItem, Order, ShippingAddress, OrderItem, OrderStatus
+from .stock import reserve_stock
 
 
-class CartItemSerializer(serializers.ModelSerializer):
-    product_detail = ProductSerializer(read_only=True, source="product")
+class CartItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    product_detail = ProductCardField(source="product_id")
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
 
     class Meta:
@@ -23,6 +26,17 @@ class CartItemSerializer(serializers.ModelSerializer):
             "updated_at",
         )
         read_only_fields = ("user",)
+        list_serializer_class = ProductCardBatchListSerializer
+
+    sparse_columns = {
+        "product_detail": ("product",),
+        "is_unavailable": ("quantity", "product__in_stock"),
+        "total_price": ("quantity", "product__price"),
+    }
+    sparse_select_related = {
+        "is_unavailable": ("product",),
+        "total_price": ("product",),
+    }
 
     def validate(self, attrs):
         product = attrs.get("product")
@@ -38,6 +52,37 @@ class CartItemSerializer(serializers.ModelSerializer):
         return cart_item
 
 
+class CartLineListSerializer(serializers.ListSerializer):
+    def validate(self, lines):
+        """
+        Collapse the lines to ``{product_id: quantity}`` (the last line for a
+        product wins) and check every product exists with one query.
+        """
+        quantities = {line["product"]: line["quantity"] for line in lines}
+        wanted = {product_id for product_id, quantity in quantities.items() if quantity}
+        found = set(
+            Product.objects.filter(pk__in=wanted).values_list("pk", flat=True)
+        )
+        if wanted - found:
+            unknown = ", ".join(str(pk) for pk in sorted(wanted - found))
+            raise serializers.ValidationError({"product": f"Unknown products: {unknown}."})
+        return quantities
+
+
+class CartLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0)
+
+    class Meta:
+        list_serializer_class = CartLineListSerializer
+
+
+class CartSummaryItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CartItem
+        fields = ("id", "product", "quantity", "is_unavailable", "total_price")
+
+
 class ShippingAddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShippingAddress
@@ -55,7 +100,7 @@ class ShippingAddressSerializer(serializers.ModelSerializer):
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    product = ProductCardField(source="product_id")
     total_price = serializers.CharField(source="price")
 
     def get_total_price(self, obj):
@@ -65,9 +110,21 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ("id", "product", "quantity", "total_price")
         read_only_fields = ("id",)
+        list_serializer_class = ProductCardBatchListSerializer
+
 
+class OrderListSerializer(ProductCardBatchListSerializer):
+    """
+    Fetches the product cards of every item of every order at once.
+    """
 
-class OrderSerializer(serializers.ModelSerializer):
+    def get_product_ids(self, orders):
+        if "items" not in self.child.fields:
+            return []
+        return [item.product_id for order in orders for item in order.items.all()]
+
+
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     shipping_address = ShippingAddressSerializer(read_only=True)
     items = OrderItemSerializer(many=True, read_only=True)
 
@@ -83,44 +140,71 @@ class OrderSerializer(serializers.ModelSerializer):
             "updated_at",
         )
         read_only_fields = ("status", "user", "items", "created_at", "updated_at")
+        list_serializer_class = OrderListSerializer
+
+    sparse_columns = {"items": ()}
+    sparse_select_related = {"shipping_address": ("shipping_address",)}
+    sparse_prefetch_related = {"items": ("items",)}
 
     def validate(self, attrs):
-        if self.instance and attrs.get("status") not in OrderStatus.choices:
-            raise serializers.ValidationError("Invalid status")
+        if self.instance:
+            if attrs.get("status") not in OrderStatus.choices:
+                raise serializers.ValidationError("Invalid status")
+            return attrs
 
+        # Checkout: the cart and address loaded here are reused by create().
         user = self.context["request"].user
-        if not CartItem.objects.filter(user=user).exists():
+        cart_items = list(
+            CartItem.objects.filter(user=user)
+            .select_related("product")
+            .only("quantity", "product_id", "product__price")
+        )
+        if not cart_items:
             raise serializers.ValidationError("You have no items in the cart.")
-        if not ShippingAddress.objects.filter(user=user).exists():
+        shipping_address = ShippingAddress.objects.filter(user=user).first()
+        if shipping_address is None:
             raise serializers.ValidationError("You have no shipping address.")
+
+        attrs["cart_items"] = cart_items
+        attrs["shipping_address"] = shipping_address
         return attrs
 
     @transaction.atomic
     def create(self, validated_data):
-        user = self.context["request"].user
-        cart_items = (
-            CartItem.objects.filter(user=user)
-            .select_related("product")
-            .prefetch_related("product__images")
+        cart_items = validated_data.pop("cart_items")
+
+        # Take exactly the lines validated, as they were; anything added
+        # meanwhile stays. The rows stay locked until commit, so a second
+        # submit of the same cart (or a concurrent edit of it) finds them
+        # gone or changed and the whole checkout rolls back.
+        lines = Q()
+        for cart_item in cart_items:
+            lines |= Q(pk=cart_item.pk, quantity=cart_item.quantity)
+        deleted, _ = CartItem.objects.filter(lines).delete()
+        if deleted != len(cart_items):
+            raise serializers.ValidationError(
+                "Your cart changed during checkout; please review it and try again."
+            )
+
+        reserve_stock(
+            (cart_item.product_id, cart_item.quantity) for cart_item in cart_items
         )
 
-        order = Order.objects.create(
-            shipping_address=user.shippingaddress, **validated_data
-        )
+        order = Order.objects.create(stock_reserved=True, **validated_data)
 
-        OrderItem.objects.bulk_create(
+        items = OrderItem.objects.bulk_create(
             [
                 OrderItem(
                     order=order,
-                    product=cart_item.product,
+                    product_id=cart_item.product_id,
                     quantity=cart_item.quantity,
                     price=cart_item.total_price,
                 )
                 for cart_item in cart_items
             ]
         )
-        cart_items.delete()
-
+        # The response renders the items just created without reading them back.
+        order._prefetched_objects_cache = {"items": items}
         return order
 
     def update(self, instance, validated_data):
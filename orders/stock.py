@@ -0,0 +1,102 @@
+"""
+Atomic stock reservation.
+
+Stock is taken with one conditional ``UPDATE ... SET in_stock = in_stock - q
+WHERE id = ... AND in_stock >= q`` per product, so concurrent checkouts never
+oversell and never wait on a ``SELECT ... FOR UPDATE`` round trip: a row is
+locked only for the duration of its own update, until the transaction ends.
+Products are updated in id order, so two checkouts sharing products always
+lock them in the same order and cannot deadlock. A reservation is
+all-or-nothing; when any line cannot be covered, none of them is taken and
+every short line is reported.
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from products.cache import bump_catalog_version, invalidate_product_cards
+from products.models import Product
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        super().__init__("Insufficient stock")
+        self.shortages = shortages
+
+
+def _quantities(lines):
+    """
+    Sum ``(product_id, quantity)`` pairs per product, in product id order.
+    """
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return sorted(quantities.items())
+
+
+def _stock_changed(product_ids):
+    def invalidate():
+        invalidate_product_cards(product_ids)
+        bump_catalog_version()
+
+    transaction.on_commit(invalidate)
+
+
+def reserve_stock(lines):
+    """
+    Take stock for ``(product_id, quantity)`` lines, or raise
+    ``InsufficientStock`` with one ``{"product", "requested", "available"}``
+    entry per line that cannot be covered.
+    """
+    quantities = _quantities(lines)
+    now = timezone.now()
+    failed = None
+    try:
+        with transaction.atomic():
+            for product_id, quantity in quantities:
+                reserved = Product.objects.filter(
+                    pk=product_id, in_stock__gte=quantity
+                ).update(in_stock=F("in_stock") - quantity, updated_at=now)
+                if not reserved:
+                    failed = product_id
+                    raise InsufficientStock([])
+    except InsufficientStock:
+        # Everything is rolled back; one read tells which lines fell short.
+        available = dict(
+            Product.objects.filter(pk__in=[pk for pk, _ in quantities]).values_list(
+                "pk", "in_stock"
+            )
+        )
+        raise InsufficientStock(
+            [
+                {
+                    "product": product_id,
+                    "requested": quantity,
+                    "available": available.get(product_id, 0),
+                }
+                for product_id, quantity in quantities
+                # Stock may have come back since; the line that failed is
+                # reported regardless.
+                if available.get(product_id, 0) < quantity or product_id == failed
+            ]
+        )
+
+    _stock_changed([product_id for product_id, _ in quantities])
+
+
+def release_stock(lines):
+    """
+    Return reserved stock, e.g. for a cancelled order.
+    """
+    quantities = _quantities(lines)
+    now = timezone.now()
+    with transaction.atomic():
+        for product_id, quantity in quantities:
+            Product.objects.filter(pk=product_id).update(
+                in_stock=F("in_stock") + quantity, updated_at=now
+            )
+    _stock_changed([product_id for product_id, _ in quantities])
+
+
+def release_order_stock(order):
+    release_stock(order.items.values_list("product_id", "quantity"))
@@ -1,3 +1,511 @@
-from django.test import TestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+import redis
+from users.models import CustomUser as User
+from products.cards import get_cards
+from products.models import Product
+from . import cartstore
+from .cartstore import DIRTY_KEY, get_cart_store
+from .models import CartItem, Order, OrderItem, ShippingAddress
+from .numbering import LENGTH, OrderNumberGenerator, number_timestamp
+from .serializers import CartItemSerializer, OrderSerializer
+from .stock import InsufficientStock, reserve_stock
 
-# Create your tests here.
+
+class CartSparseFieldsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.client.force_authenticate(self.user)
+        for i in range(3):
+            product = Product.objects.create(
+                added_by=self.user, name=f"Product {i}", description="-", price=10, in_stock=5
+            )
+            CartItem.objects.create(user=self.user, product=product, quantity=2)
+
+    def test_cart_fields(self):
+        url = reverse("cart-item-list-create")
+
+        # Only the cart rows: no product join, no cards.
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"fields": "id,product,quantity"})
+        self.assertEqual(set(response.data[0]), {"id", "product", "quantity"})
+
+        response = self.client.get(url, {"fields": "total_price,product_detail"})
+        self.assertEqual(response.data[0]["total_price"], 20)
+        self.assertEqual(response.data[0]["product_detail"]["price"], "10.00")
+
+
+class StockReservationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.client.force_authenticate(self.user)
+        self.products = [
+            Product.objects.create(
+                added_by=self.user, name=f"Product {i}", description="-", price=10, in_stock=5
+            )
+            for i in range(3)
+        ]
+        ShippingAddress.objects.create(
+            user=self.user,
+            address_line_1="1 Main St",
+            city="Town",
+            postal_code="12345",
+            country="Country",
+        )
+
+    def stock(self):
+        return [
+            Product.objects.values_list("in_stock", flat=True).get(pk=product.pk)
+            for product in self.products
+        ]
+
+    def test_reserve(self):
+        a, b, c = self.products
+        # Lines for the same product add up: one update per product, in a
+        # savepoint.
+        with self.assertNumQueries(4):
+            reserve_stock([(b.pk, 2), (a.pk, 1), (b.pk, 3)])
+        self.assertEqual(self.stock(), [4, 0, 5])
+
+    def test_all_or_nothing(self):
+        a, b, c = self.products
+        with self.assertRaises(InsufficientStock) as cm:
+            reserve_stock([(a.pk, 1), (b.pk, 6), (c.pk, 7), (0, 1)])
+
+        self.assertEqual(
+            cm.exception.shortages,
+            [
+                {"product": 0, "requested": 1, "available": 0},
+                {"product": b.pk, "requested": 6, "available": 5},
+                {"product": c.pk, "requested": 7, "available": 5},
+            ],
+        )
+        self.assertEqual(self.stock(), [5, 5, 5])
+
+    def test_checkout_reserves_stock(self):
+        a, b, c = self.products
+        CartItem.objects.create(user=self.user, product=a, quantity=2)
+        CartItem.objects.create(user=self.user, product=b, quantity=5)
+
+        response = self.client.post(reverse("order-create"), {})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stock(), [3, 0, 5])
+
+        # The cart is empty now; a second order for the last units fails.
+        CartItem.objects.create(user=self.user, product=a, quantity=1)
+        CartItem.objects.create(user=self.user, product=b, quantity=1)
+        response = self.client.post(reverse("order-create"), {})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            response.data["items"],
+            [{"product": b.pk, "requested": 1, "available": 0}],
+        )
+        self.assertEqual(self.stock(), [3, 0, 5])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_cancel_releases_stock(self):
+        a = self.products[0]
+        CartItem.objects.create(user=self.user, product=a, quantity=2)
+        order_id = self.client.post(reverse("order-create"), {}).data["id"]
+        self.assertEqual(self.stock()[0], 3)
+
+        manager = User.objects.create_user(username="manager", password="managerpass")
+        manager.groups.add(Group.objects.create(name="Manager"))
+        self.client.force_authenticate(manager)
+        url = reverse("order-status-update", args=[order_id])
+        self.client.patch(url, {"status": "cancelled"})
+        self.client.patch(url, {"status": "cancelled"})
+        self.assertEqual(self.stock()[0], 5)
+
+        response = self.client.patch(url, {"status": "pending"})
+        self.assertEqual(response.status_code, 400)
+        self.client.patch(url, {"status": "cancelled"})
+        self.assertEqual(self.stock()[0], 5)
+
+    def test_cancel_without_reservation_keeps_stock(self):
+        a = self.products[0]
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=a, quantity=2, price=a.price)
+
+        manager = User.objects.create_user(username="manager", password="managerpass")
+        manager.groups.add(Group.objects.create(name="Manager"))
+        self.client.force_authenticate(manager)
+        url = reverse("order-status-update", args=[order.pk])
+        self.client.patch(url, {"status": "cancelled"})
+
+        self.assertEqual(self.stock()[0], 5)
+
+
+class OrderNumberTests(APITestCase):
+    def test_sortable_and_unique(self):
+        now = [1750000000.0]
+        generate = OrderNumberGenerator(worker_id=7, clock=lambda: now[0])
+
+        numbers = [generate() for _ in range(1000)]
+        # The clock stepping back doesn't break the order either.
+        now[0] -= 5
+        numbers += [generate() for _ in range(10)]
+
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertTrue(all(len(number) == LENGTH for number in numbers))
+        self.assertEqual(number_timestamp(numbers[0]), 1750000000.0)
+
+    def test_worker_ids_never_collide(self):
+        clock = lambda: 1750000000.0  # noqa: E731
+        a = OrderNumberGenerator(worker_id=1, clock=clock)
+        b = OrderNumberGenerator(worker_id=2, clock=clock)
+        numbers = [generate() for _ in range(300) for generate in (a, b)]
+        self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_order_save(self):
+        user = User.objects.create_user(username="testuser", password="userpass")
+
+        with self.assertNumQueries(1):
+            order = Order.objects.create(user=user)
+        self.assertEqual(len(order.order_number), LENGTH)
+
+        legacy = Order.objects.create(user=user, order_number="abc123xyz")
+        self.assertEqual(Order.objects.get(order_number="abc123xyz"), legacy)
+        self.assertIsNone(number_timestamp(legacy.order_number))
+
+
+class CheckoutTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        # A fresh instance, as the request would have: nothing cached on it.
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        self.url = reverse("order-create")
+
+    def fill_cart(self, lines):
+        products = [
+            Product.objects.create(
+                added_by=self.user, name=f"Product {i}", description="-", price=10, in_stock=5
+            )
+            for i in range(lines)
+        ]
+        for product in products:
+            CartItem.objects.create(user=self.user, product=product, quantity=2)
+        # Cards are normally warm; their cost isn't part of checkout.
+        get_cards([product.pk for product in products])
+
+    def add_address(self):
+        ShippingAddress.objects.create(
+            user=self.user,
+            address_line_1="1 Main St",
+            city="Town",
+            postal_code="12345",
+            country="Country",
+        )
+
+    def test_query_budget(self):
+        self.add_address()
+        for lines in (3, 6):
+            self.fill_cart(lines)
+            # Cart, address, the order and its items, the cart delete and
+            # transaction bookkeeping, plus one stock update per product.
+            with self.assertNumQueries(9 + lines):
+                response = self.client.post(self.url, {})
+
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data["items"]), lines)
+            self.assertEqual(response.data["items"][0]["total_price"], "20.00")
+            self.assertEqual(response.data["shipping_address"]["city"], "Town")
+            self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_validation(self):
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("no items", str(response.data))
+
+        self.fill_cart(1)
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("no shipping address", str(response.data))
+        self.assertFalse(Order.objects.exists())
+
+    def test_cart_changed_during_checkout(self):
+        self.add_address()
+        self.fill_cart(2)
+        request = Request(APIRequestFactory().post(self.url))
+        request.user = self.user
+        first, second = CartItem.objects.filter(user=self.user).order_by("pk")
+
+        # Validated, then the cart changes (or an earlier submit of it wins)
+        # before the order is written.
+        for change in (
+            lambda: CartItem.objects.filter(pk=first.pk).update(quantity=3),
+            lambda: CartItem.objects.filter(pk=second.pk).delete(),
+        ):
+            serializer = OrderSerializer(data={}, context={"request": request})
+            serializer.is_valid(raise_exception=True)
+            change()
+            with self.assertRaises(ValidationError):
+                serializer.save(user=self.user)
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.get(pk=first.pk).quantity, 3)
+        self.assertEqual(Product.objects.get(pk=first.product_id).in_stock, 5)
+
+
+class CartBulkUpdateTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.client.force_authenticate(self.user)
+        self.url = reverse("cart-item-bulk")
+        self.products = [
+            Product.objects.create(
+                added_by=self.user, name=f"Product {i}", description="-", price=10, in_stock=5
+            )
+            for i in range(14)
+        ]
+        self.kept = CartItem.objects.create(user=self.user, product=self.products[0])
+        CartItem.objects.create(user=self.user, product=self.products[1])
+
+    def cart(self):
+        return dict(
+            CartItem.objects.filter(user=self.user).values_list("product_id", "quantity")
+        )
+
+    def test_patch(self):
+        a, b = self.products[:2]
+        lines = [{"product": product.pk, "quantity": 1} for product in self.products[2:]]
+        lines += [{"product": a.pk, "quantity": 3}, {"product": b.pk, "quantity": 0}]
+
+        # Product check, upsert, delete and summary, plus the transaction.
+        with self.assertNumQueries(6):
+            response = self.client.patch(self.url, lines, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        expected = {product.pk: 1 for product in self.products[2:]}
+        expected[a.pk] = 3
+        self.assertEqual(self.cart(), expected)
+        # The existing line was updated in place.
+        self.assertEqual(CartItem.objects.get(user=self.user, product=a).pk, self.kept.pk)
+        self.assertEqual(response.data["total_quantity"], 15)
+        self.assertEqual(response.data["total_price"], 150)
+        self.assertEqual(len(response.data["items"]), 13)
+
+    def test_put_replaces(self):
+        c = self.products[2]
+        response = self.client.put(
+            self.url,
+            [{"product": c.pk, "quantity": 1}, {"product": c.pk, "quantity": 2}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {c.pk: 2})
+
+        response = self.client.put(self.url, [], format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {})
+
+    def test_validation(self):
+        before = self.cart()
+        for lines in (
+            [{"product": 0, "quantity": 1}],
+            [{"product": self.products[2].pk, "quantity": -1}],
+            [{"product": 999999, "quantity": 1}],
+            [],
+        ):
+            response = self.client.patch(self.url, lines, format="json")
+            self.assertEqual(response.status_code, 400, lines)
+        self.assertEqual(self.cart(), before)
+
+
+TEST_CART_REDIS_URL = settings.CART_REDIS_URL.rsplit("/", 1)[0] + "/15"
+
+
+def redis_available():
+    try:
+        redis.Redis.from_url(TEST_CART_REDIS_URL, socket_connect_timeout=0.2).ping()
+    except redis.RedisError:
+        return False
+    return True
+
+
+@skipUnless(redis_available(), "Redis is not available")
+@override_settings(CART_BACKEND="redis", CART_REDIS_URL=TEST_CART_REDIS_URL)
+class RedisCartTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        cartstore._store = None
+        self.store = get_cart_store()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.client.force_authenticate(self.user)
+        self.products = [
+            Product.objects.create(
+                added_by=self.user, name=f"Product {i}", description="-", price=10, in_stock=5
+            )
+            for i in range(3)
+        ]
+        get_cards([product.pk for product in self.products])
+        self.url = reverse("cart-item-list-create")
+
+    def tearDown(self):
+        keys = list(self.store.client.scan_iter("cart:*"))
+        if keys:
+            self.store.client.delete(*keys)
+        cartstore._store = None
+
+    def detail_url(self, product):
+        return reverse("cart-item-detail", args=[product.pk])
+
+    def db_cart(self):
+        return dict(
+            CartItem.objects.filter(user=self.user).values_list("product_id", "quantity")
+        )
+
+    def test_cart_operations(self):
+        a, b, c = self.products
+        response = self.client.post(self.url, {"product": a.pk, "quantity": 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.data), set(CartItemSerializer.Meta.fields))
+        self.assertEqual(response.data["id"], a.pk)
+        self.assertEqual(response.data["total_price"], 20)
+        self.assertEqual(response.data["product_detail"]["name"], "Product 0")
+
+        response = self.client.post(self.url, {"product": a.pk, "quantity": 1})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {"product": 999999, "quantity": 1})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.post(self.url, {"product": b.pk, "quantity": 1})
+        response = self.client.patch(self.detail_url(b), {"quantity": 5})
+        self.assertEqual(response.data["is_unavailable"], True)
+
+        # Reads touch neither the database nor the serializers' querysets.
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {"fields": "product,quantity"})
+        self.assertEqual(
+            response.data, [{"product": b.pk, "quantity": 5}, {"product": a.pk, "quantity": 2}]
+        )
+
+        self.assertEqual(self.client.delete(self.detail_url(a)).status_code, 204)
+        self.assertEqual(self.client.delete(self.detail_url(a)).status_code, 404)
+        self.assertEqual(self.client.patch(self.detail_url(c), {"quantity": 1}).status_code, 404)
+
+    def test_write_behind(self):
+        a, b, c = self.products
+        CartItem.objects.create(user=self.user, product=c)
+        self.client.patch(
+            reverse("cart-item-bulk"),
+            [{"product": a.pk, "quantity": 2}, {"product": b.pk, "quantity": 1}],
+            format="json",
+        )
+        self.assertEqual(self.db_cart(), {c.pk: 1})
+
+        call_command("persist_carts", stdout=StringIO())
+        self.assertEqual(self.db_cart(), {a.pk: 2, b.pk: 1})
+        self.assertFalse(self.store.client.sismember(DIRTY_KEY, f"user:{self.user.pk}"))
+
+        response = self.client.put(
+            reverse("cart-item-bulk"), [{"product": b.pk, "quantity": 3}], format="json"
+        )
+        self.assertEqual(response.data["total_quantity"], 3)
+        call_command("persist_carts", stdout=StringIO())
+        self.assertEqual(self.db_cart(), {b.pk: 3})
+
+    def test_persist_skips_failures_and_deleted_users(self):
+        a = self.products[0]
+        gone = User.objects.create_user(username="gone", password="userpass")
+        for user in (self.user, gone):
+            self.store.add(f"user:{user.pk}", a.pk, 1)
+        self.store.add("user:999999", a.pk, 1)
+        gone_id = gone.pk
+        gone.delete()
+
+        original = cartstore.update_cart
+
+        def update_cart(user, *args, **kwargs):
+            if user.pk == self.user.pk:
+                raise RuntimeError("database is down")
+            return original(user, *args, **kwargs)
+
+        with patch.object(cartstore, "update_cart", update_cart):
+            with self.assertLogs("orders.cartstore", "ERROR"):
+                call_command("persist_carts", stdout=StringIO())
+
+        # The failed cart stays dirty; the orphaned ones are gone for good.
+        self.assertEqual(
+            self.store.client.smembers(DIRTY_KEY), {f"user:{self.user.pk}".encode()}
+        )
+        self.assertFalse(self.store.client.exists(f"cart:user:{gone_id}"))
+
+        call_command("persist_carts", stdout=StringIO())
+        self.assertEqual(self.db_cart(), {a.pk: 1})
+
+    def test_load(self):
+        a, b, c = self.products
+        CartItem.objects.create(user=self.user, product=a, quantity=4)
+
+        call_command("persist_carts", "--load", stdout=StringIO())
+
+        response = self.client.get(self.url)
+        self.assertEqual([(line["id"], line["quantity"]) for line in response.data], [(a.pk, 4)])
+
+    def test_checkout(self):
+        a, b, c = self.products
+        ShippingAddress.objects.create(
+            user=self.user,
+            address_line_1="1 Main St",
+            city="Town",
+            postal_code="12345",
+            country="Country",
+        )
+        self.client.post(self.url, {"product": a.pk, "quantity": 2})
+        self.client.post(self.url, {"product": b.pk, "quantity": 1})
+
+        response = self.client.post(reverse("order-create"), {})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["items"]), 2)
+        self.assertEqual(self.client.get(self.url).data, [])
+        call_command("persist_carts", stdout=StringIO())
+        self.assertEqual(self.db_cart(), {})
+
+    def test_anonymous_cart(self):
+        a = self.products[0]
+        client = APIClient()
+        self.assertEqual(client.get(self.url).data, [])
+
+        response = client.post(self.url, {"product": a.pk, "quantity": 1})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual([line["id"] for line in client.get(self.url).data], [a.pk])
+        # Checkout still needs an account.
+        self.assertIn(client.post(reverse("order-create"), {}).status_code, (401, 403))
+
+    def test_anonymous_cart_joins_the_account(self):
+        a, b, c = self.products
+        self.client.post(self.url, {"product": a.pk, "quantity": 3})
+        client = APIClient()
+        client.post(self.url, {"product": a.pk, "quantity": 1})
+        client.post(self.url, {"product": b.pk, "quantity": 2})
+
+        client.force_authenticate(self.user)
+        lines = [(line["id"], line["quantity"]) for line in client.get(self.url).data]
+
+        self.assertEqual(sorted(lines), [(a.pk, 3), (b.pk, 2)])
+        self.assertEqual(list(self.store.client.scan_iter("cart:session:*")), [])
+        # Merged once: the session no longer points at a cart.
+        client.force_authenticate(None)
+        self.assertEqual(client.get(self.url).data, [])
@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import (
+    CartItemBulkUpdate,
     CartItemListCreate,
     CartItemUpdateDestroy,
     OrderListCreate,
@@ -14,6 +15,7 @@ from .views import (
 
 urlpatterns = [
     path("cart/", CartItemListCreate.as_view(), name="cart-item-list-create"),
+    path("cart/bulk/", CartItemBulkUpdate.as_view(), name="cart-item-bulk"),
     path("cart/<int:pk>/", CartItemUpdateDestroy.as_view(), name="cart-item-detail"),
     path("orders/", OrderListCreate.as_view(), name="order-create"),
     path("orders/<int:pk>/", OrderStatusUpdate.as_view(), name="order-status-update"),
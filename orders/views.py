@@ -1,17 +1,101 @@
 from rest_framework import generics, permissions
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings
+from django.db import transaction
+from decimal import Decimal
 from common.permissions import IsManager
-from .models import CartItem, Order, ShippingAddress
-from .serializers import CartItemSerializer, OrderSerializer, ShippingAddressSerializer
+from common.views import SparseFieldsQuerySetMixin
+from products.cards import get_cards
+from .carts import MAX_CART_LINES, get_cart_lines, update_cart
+from .cartstore import get_cart_store, owner_key, render_lines
+from .models import CartItem, Order, OrderStatus, ShippingAddress
+from .serializers import (
+    CartItemSerializer,
+    CartLineSerializer,
+    CartSummaryItemSerializer,
+    OrderSerializer,
+    ShippingAddressSerializer,
+)
+from .stock import InsufficientStock, release_order_stock
+import logging
 import stripe
 
+logger = logging.getLogger(__name__)
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
-class CartItemListCreate(generics.ListCreateAPIView):
+@transaction.atomic
+def set_order_status(order, status):
+    """
+    Save a status change. Cancelling returns the stock the order holds, if it
+    holds any; the flag is cleared in the same ``UPDATE``, so racing or
+    repeated cancellations can't return it twice. Cancelled orders can't be
+    reopened.
+    """
+    if status not in OrderStatus.values:
+        raise ValidationError({"status": f"Invalid status: {status}"})
+
+    current = (
+        Order.objects.select_for_update().values_list("status", flat=True).get(pk=order.pk)
+    )
+    if current == OrderStatus.cancelled and status != OrderStatus.cancelled:
+        raise ValidationError({"status": "Cancelled orders can't be reopened."})
+
+    released = status == OrderStatus.cancelled and Order.objects.filter(
+        pk=order.pk, stock_reserved=True
+    ).update(stock_reserved=False, status=status)
+    order.status = status
+    order.save(update_fields=["status", "payment_status", "updated_at"])
+    if released:
+        order.stock_reserved = False
+        release_order_stock(order)
+
+
+class CartStoreMixin:
+    """
+    Serve the cart from the Redis store when ``CART_BACKEND`` is ``"redis"``;
+    anonymous visitors then get a session cart, which joins their account's
+    cart once they sign in.
+    """
+
+    @property
+    def cart_store(self):
+        return get_cart_store()
+
+    def get_permissions(self):
+        if self.cart_store is not None:
+            return [permissions.AllowAny()]
+        return super().get_permissions()
+
+    def get_store_line(self, request, owner, product_id):
+        lines = self.cart_store.get_lines(owner)
+        return render_lines(
+            request, [line for line in lines if line["product"] == product_id]
+        )[0]
+
+    def validate_store_line(self, data):
+        serializer = CartLineSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        product_id = serializer.validated_data["product"]
+        quantity = serializer.validated_data["quantity"]
+        if quantity < 1:
+            raise ValidationError(
+                {"quantity": "Ensure this value is greater than or equal to 1."}
+            )
+        # The card cache doubles as the existence check.
+        if not get_cards([product_id]):
+            raise ValidationError(
+                {"product": f'Invalid pk "{product_id}" - object does not exist.'}
+            )
+        return product_id, quantity
+
+
+class CartItemListCreate(
+    CartStoreMixin, SparseFieldsQuerySetMixin, generics.ListCreateAPIView
+):
     """
     List all cart items or create a new cart item.
     """
@@ -24,15 +108,32 @@ class CartItemListCreate(generics.ListCreateAPIView):
         return (
             CartItem.objects.filter(user=self.request.user)
             .select_related("product")
-            .prefetch_related("product__images")
             .order_by("-created_at")
         )
 
+    def list(self, request, *args, **kwargs):
+        if self.cart_store is None:
+            return super().list(request, *args, **kwargs)
+        owner = owner_key(request)
+        lines = self.cart_store.get_lines(owner) if owner else []
+        return Response(render_lines(request, lines))
+
+    def create(self, request, *args, **kwargs):
+        if self.cart_store is None:
+            return super().create(request, *args, **kwargs)
+        product_id, quantity = self.validate_store_line(request.data)
+        owner = owner_key(request, create=True)
+        if not self.cart_store.add(owner, product_id, quantity):
+            raise ValidationError("Product already in your cart")
+        return Response(self.get_store_line(request, owner, product_id), status=201)
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class CartItemUpdateDestroy(generics.UpdateAPIView, generics.DestroyAPIView):
+class CartItemUpdateDestroy(
+    CartStoreMixin, generics.UpdateAPIView, generics.DestroyAPIView
+):
     """
     Update or delete a cart item
     """
@@ -43,8 +144,78 @@ class CartItemUpdateDestroy(generics.UpdateAPIView, generics.DestroyAPIView):
     def get_queryset(self):
         return CartItem.objects.filter(user=self.request.user).select_related("product")
 
+    def update(self, request, *args, **kwargs):
+        if self.cart_store is None:
+            return super().update(request, *args, **kwargs)
+        product_id, quantity = self.validate_store_line(
+            {"product": kwargs["pk"], "quantity": request.data.get("quantity")}
+        )
+        owner = owner_key(request)
+        if owner is None or not self.cart_store.set_quantity(
+            owner, product_id, quantity
+        ):
+            raise NotFound()
+        return Response(self.get_store_line(request, owner, product_id))
+
+    def destroy(self, request, *args, **kwargs):
+        if self.cart_store is None:
+            return super().destroy(request, *args, **kwargs)
+        owner = owner_key(request)
+        if owner is None or not self.cart_store.remove(owner, [kwargs["pk"]]):
+            raise NotFound()
+        return Response(status=204)
+
+
+class CartItemBulkUpdate(CartStoreMixin, APIView):
+    """
+    Set the quantities of many cart lines at once; a zero quantity removes the
+    line. ``PUT`` replaces the whole cart, ``PATCH`` only touches the given
+    products. Returns the updated cart summary.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
 
-class OrderListCreate(generics.ListCreateAPIView):
+    def put(self, request, *args, **kwargs):
+        return self.apply(request, replace=True)
+
+    def patch(self, request, *args, **kwargs):
+        return self.apply(request, replace=False)
+
+    def apply(self, request, replace):
+        serializer = CartLineSerializer(
+            data=request.data, many=True, allow_empty=replace, max_length=MAX_CART_LINES
+        )
+        serializer.is_valid(raise_exception=True)
+        if self.cart_store is None:
+            update_cart(request.user, serializer.validated_data, replace=replace)
+            return Response(self.summary(request.user))
+
+        owner = owner_key(request, create=True)
+        self.cart_store.update(owner, serializer.validated_data, replace=replace)
+        return Response(self.store_summary(request, owner))
+
+    def summary(self, user):
+        lines = list(get_cart_lines(user))
+        return {
+            "items": CartSummaryItemSerializer(lines, many=True).data,
+            "total_quantity": sum(line.quantity for line in lines),
+            "total_price": sum((line.total_price for line in lines), Decimal(0)),
+        }
+
+    def store_summary(self, request, owner):
+        fields = CartSummaryItemSerializer.Meta.fields
+        items = [
+            {name: item[name] for name in fields}
+            for item in render_lines(request, self.cart_store.get_lines(owner))
+        ]
+        return {
+            "items": items,
+            "total_quantity": sum(item["quantity"] for item in items),
+            "total_price": sum((item["total_price"] for item in items), Decimal(0)),
+        }
+
+
+class OrderListCreate(SparseFieldsQuerySetMixin, generics.ListCreateAPIView):
     """
     Create a new order
     """
@@ -56,11 +227,29 @@ class OrderListCreate(generics.ListCreateAPIView):
         return (
             Order.objects.filter(user=self.request.user)
             .select_related("shipping_address")
-            .prefetch_related("items__product__images")
+            .prefetch_related("items")
         )
 
+    def create(self, request, *args, **kwargs):
+        store = get_cart_store()
+        if store is not None:
+            # Checkout reads CartItem rows: bring them up to date first.
+            store.persist(owner_key(request))
+        try:
+            return super().create(request, *args, **kwargs)
+        except InsufficientStock as exc:
+            return Response(
+                {"detail": "Some items are out of stock.", "items": exc.shortages},
+                status=409,
+            )
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        order = serializer.save(user=self.request.user)
+        store = get_cart_store()
+        if store is not None:
+            store.remove(
+                owner_key(self.request), [item.product_id for item in order.items.all()]
+            )
 
 
 class OrderStatusUpdate(generics.UpdateAPIView):
@@ -77,8 +266,7 @@ class OrderStatusUpdate(generics.UpdateAPIView):
         status = request.data.get("status")
 
         if status:
-            order.status = status
-            order.save()
+            set_order_status(order, status)
             return Response({"status": "success", "data": OrderSerializer(order).data})
         else:
             return Response(
@@ -86,7 +274,7 @@ class OrderStatusUpdate(generics.UpdateAPIView):
             )
 
 
-class OrderItemRetrieve(generics.RetrieveAPIView):
+class OrderItemRetrieve(SparseFieldsQuerySetMixin, generics.RetrieveAPIView):
     """
     Retrieve an order item
     """
@@ -98,7 +286,7 @@ class OrderItemRetrieve(generics.RetrieveAPIView):
         return (
             Order.objects.filter(user=self.request.user)
             .select_related("shipping_address")
-            .prefetch_related("items__product__images")
+            .prefetch_related("items")
         )
 
 
@@ -201,14 +389,18 @@ class StripeWebhook(APIView):
             order_number = session["metadata"]["order_number"]
             order = Order.objects.get(order_number=order_number)
             order.payment_status = "paid"
-            order.status = "processing"
-            order.save()
+            try:
+                set_order_status(order, "processing")
+            except ValidationError:
+                # Paid after it was cancelled: keep the payment on record and
+                # leave the refund to a manager.
+                logger.warning("Order %s was paid after cancellation", order.pk)
+                order.save(update_fields=["payment_status", "updated_at"])
         elif event["type"] == "checkout.session.expired":
             session = event["data"]["object"]
             order_number = session["metadata"]["order_number"]
             order = Order.objects.get(order_number=order_number)
             order.payment_status = "failed"
-            order.status = "cancelled"
-            order.save()
+            set_order_status(order, "cancelled")
 
         return Response(status=200)
@@ -0,0 +1,219 @@
+"""
+Async read-only variants of the hot catalog endpoints, for ASGI workers.
+
+Database reads use the async ORM and cache reads the async cache API, so a
+worker keeps serving other requests while one waits on I/O. DRF's
+authentication, permission and throttling checks and the filter backends stay
+synchronous and run in a worker thread; serializers only ever see prefetched
+data.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views import View
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import filters, permissions
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .cache import aget_catalog_version, response_cache_key
+from .cards import aget_cards, with_absolute_urls
+from .categories import aget_category_tree
+from .conditional import check_conditions
+from .filters import (
+    ProductFilter,
+    ProductOrderingFilter,
+    ProductReviewFilter,
+    ProductSearchFilter,
+)
+from .models import Product, ProductReview
+from .paginations import ProductCursorPagination, ReviewCursorPagination
+from .ratings import SUMMARY_FIELDS, rating_summary
+from .serializers import ProductReviewSerializer, ProductSerializer
+
+
+class AsyncAPIView(View):
+    """
+    Base for async ``GET`` endpoints returning DRF ``Response`` objects.
+    """
+
+    http_method_names = ["get", "head", "options"]
+    renderer_classes = (JSONRenderer,)
+    permission_classes = (permissions.AllowAny,)
+    filter_backends = ()
+
+    async def dispatch(self, request, *args, **kwargs):
+        api_view = APIView(
+            renderer_classes=self.renderer_classes,
+            permission_classes=self.permission_classes,
+        )
+        api_view.args, api_view.kwargs, api_view.headers = args, kwargs, {}
+        request = api_view.initialize_request(request, *args, **kwargs)
+        api_view.request = request
+        try:
+            await sync_to_async(api_view.initial)(request, *args, **kwargs)
+            response = await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            response = api_view.handle_exception(exc)
+
+        if not isinstance(response, Response):
+            return response
+        return api_view.finalize_response(request, response, *args, **kwargs).render()
+
+    def filter_queryset(self, request, queryset):
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        return queryset
+
+    async def afilter_queryset(self, request, queryset):
+        # Filters may consult caches or the category snapshot; building the
+        # query is cheap, so do it off the event loop.
+        return await sync_to_async(self.filter_queryset)(request, queryset)
+
+
+def _with_headers(response, headers):
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+class AsyncProductListView(AsyncAPIView):
+    """
+    Product cards with keyset pagination; same filters as the product list.
+    """
+
+    filter_backends = (DjangoFilterBackend, ProductOrderingFilter, ProductSearchFilter)
+    filterset_class = ProductFilter
+    ordering_fields = ["price", "rating"]
+
+    async def get(self, request, *args, **kwargs):
+        version = await aget_catalog_version()
+        not_modified, headers = check_conditions(request, version)
+        if not_modified is not None:
+            return not_modified
+
+        key = response_cache_key(request, version)
+        data = await cache.aget(key)
+        if data is not None:
+            return _with_headers(Response(data, headers={"X-Cache": "HIT"}), headers)
+
+        queryset = Product.objects.only(*ProductCursorPagination.cursor_fields)
+        queryset = await self.afilter_queryset(request, queryset.order_by("-created_at"))
+        paginator = ProductCursorPagination()
+        page = await paginator.apaginate_queryset(queryset, request, view=self)
+
+        cards = await aget_cards([product.pk for product in page])
+        response = paginator.get_paginated_response(
+            [
+                with_absolute_urls(cards[product.pk], request)
+                for product in page
+                if product.pk in cards
+            ]
+        )
+        await cache.aset(key, response.data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return _with_headers(response, headers)
+
+
+class AsyncProductDetailView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        # Revalidation only needs the timestamp, as in the sync view.
+        updated_at = (
+            await Product.objects.filter(pk=kwargs["pk"])
+            .values_list("updated_at", flat=True)
+            .afirst()
+        )
+        if updated_at is None:
+            raise NotFound()
+
+        not_modified, headers = check_conditions(
+            request, updated_at.isoformat(), updated_at
+        )
+        if not_modified is not None:
+            return not_modified
+
+        product = (
+            await Product.objects.prefetch_related("images__variants")
+            .filter(pk=kwargs["pk"])
+            .afirst()
+        )
+        if product is None:
+            raise NotFound()
+
+        data = ProductSerializer(product, context={"request": request}).data
+        return _with_headers(Response(data), headers)
+
+
+class AsyncProductReviewListView(AsyncAPIView):
+    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
+    filterset_class = ProductReviewFilter
+    ordering_fields = ["created_at", "rating"]
+
+    async def get(self, request, *args, **kwargs):
+        product = (
+            await Product.objects.only(*SUMMARY_FIELDS).filter(pk=kwargs["pk"]).afirst()
+        )
+        if product is None:
+            raise NotFound()
+
+        queryset = (
+            ProductReview.objects.filter(product_id=product.pk)
+            .select_related("user")
+            .order_by("-created_at")
+        )
+        queryset = await self.afilter_queryset(request, queryset)
+        paginator = ReviewCursorPagination()
+        page = await paginator.apaginate_queryset(queryset, request, view=self)
+
+        response = paginator.get_paginated_response(
+            ProductReviewSerializer(page, many=True, context={"request": request}).data
+        )
+        response.data["summary"] = rating_summary(product)
+        return response
+
+
+def _category(node, depth):
+    data = {"id": node["id"], "name": node["name"], "slug": node["slug"]}
+    if depth:
+        data["subcategories"] = [
+            _category(child, depth - 1) for child in node["subcategories"]
+        ]
+    return data
+
+
+class AsyncCategoryListView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        tree = await aget_category_tree()
+        not_modified, headers = check_conditions(request, tree.version)
+        if not_modified is not None:
+            return not_modified
+
+        data = [_category(root, depth=1) for root in tree.roots]
+        return _with_headers(Response(data), headers)
+
+
+class AsyncCategoryRetrieveView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        tree = await aget_category_tree()
+        node = tree.get_node(kwargs["pk"])
+        if node is None:
+            raise NotFound()
+
+        not_modified, headers = check_conditions(request, tree.version)
+        if not_modified is not None:
+            return not_modified
+        return _with_headers(Response(_category(node, depth=1)), headers)
+
+
+class AsyncCategoryTreeView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        tree = await aget_category_tree()
+        not_modified, headers = check_conditions(request, tree.version)
+        if not_modified is not None:
+            return not_modified
+        return _with_headers(
+            HttpResponse(tree.tree_json, content_type="application/json"), headers
+        )
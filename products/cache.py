@@ -0,0 +1,163 @@
+"""
+Generational response cache for catalog reads.
+
+Every cache key embeds the current catalog version. Any write to a product,
+product image or category bumps that version, which orphans all older entries
+at once without scanning for keys; stale entries simply expire.
+"""
+
+import hashlib
+import time
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+VERSION_KEY = "catalog:version"
+CATEGORY_TREE_VERSION_KEY = "catalog:category-tree:version"
+HITS_KEY = "catalog:cache:hits"
+MISSES_KEY = "catalog:cache:misses"
+CARD_KEY = "product:card:{}"
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing (or evicted). Start from the clock so a lost version never
+        # goes backwards and revives entries written under an older one.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        return cache.incr(key)
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = bump_version(key)
+    return version
+
+
+async def aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        version = await sync_to_async(bump_version)(key)
+    return version
+
+
+def get_catalog_version():
+    return get_version(VERSION_KEY)
+
+
+async def aget_catalog_version():
+    return await aget_version(VERSION_KEY)
+
+
+def bump_catalog_version():
+    return bump_version(VERSION_KEY)
+
+
+def get_category_tree_version():
+    return get_version(CATEGORY_TREE_VERSION_KEY)
+
+
+async def aget_category_tree_version():
+    return await aget_version(CATEGORY_TREE_VERSION_KEY)
+
+
+def bump_category_tree_version():
+    return bump_version(CATEGORY_TREE_VERSION_KEY)
+
+
+def card_key(product_id):
+    return CARD_KEY.format(product_id)
+
+
+def invalidate_product_cards(product_ids):
+    cache.delete_many([card_key(product_id) for product_id in product_ids])
+
+
+def normalize_query(query_params):
+    """
+    Canonical form of a query string: keys and repeated values sorted, empty
+    values dropped, so equivalent requests share one cache entry.
+    """
+    items = []
+    for key in sorted(query_params):
+        values = sorted(value for value in query_params.getlist(key) if value != "")
+        if values:
+            items.append((key, values))
+    return urlencode(items, doseq=True)
+
+
+def response_cache_key(request, version=None):
+    signature = "{}{}?{}".format(
+        request.get_host(), request.path, normalize_query(request.query_params)
+    )
+    digest = hashlib.sha1(signature.encode()).hexdigest()
+    if version is None:
+        version = get_catalog_version()
+    return f"catalog:response:{version}:{digest}"
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "version": get_catalog_version(),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+    }
+
+
+def reset_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+class CachedResponseMixin:
+    """
+    Serve ``list``/``retrieve`` from the generational catalog cache.
+
+    Runs after authentication, permission and throttling checks, and only
+    successful responses are stored.
+    """
+
+    def get_cache_timeout(self):
+        return settings.CATALOG_CACHE_TIMEOUT
+
+    def cached_response(self, request, render):
+        key = response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _count(HITS_KEY)
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+
+        _count(MISSES_KEY)
+        response = render()
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=self.get_cache_timeout())
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs),
+        )
@@ -0,0 +1,174 @@
+"""
+Per-product render cache of the listing card (``ProductListSerializer``).
+
+Cards are stored in the default cache, one key per product, and fetched for a
+whole page, cart or order with a single ``get_many``. Misses are rendered in
+one batch and written back with ``set_many``. Writes to a product or its
+images drop its card (see ``invalidate_product_cards``).
+
+Cards are rendered without a request, so media URLs are stored as the storage
+returns them and made absolute per response.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.manager import BaseManager
+from rest_framework import serializers
+from .cache import card_key
+from .models import Product
+
+
+# Cached in place of the card of a product that doesn't exist.
+NO_CARD = False
+
+
+def card_queryset():
+    return Product.objects.select_related("primary_image").prefetch_related(
+        "primary_image__variants"
+    )
+
+
+def render_cards(products):
+    from .serializers import ProductListSerializer
+
+    return {product.pk: ProductListSerializer(product).data for product in products}
+
+
+def get_cards(product_ids):
+    """
+    Cards for ``product_ids`` keyed by product id. Ids that don't exist are
+    left out.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+
+    cards = _found(product_ids, cache.get_many([card_key(pk) for pk in product_ids]))
+    missing = product_ids - cards.keys()
+    if missing:
+        rendered = render_cards(card_queryset().filter(pk__in=missing))
+        for entries, timeout in _entries(missing, rendered):
+            cache.set_many(entries, timeout=timeout)
+        cards.update(rendered)
+    return {pk: card for pk, card in cards.items() if card is not NO_CARD}
+
+
+async def aget_cards(product_ids):
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+
+    found = await cache.aget_many([card_key(pk) for pk in product_ids])
+    cards = _found(product_ids, found)
+    missing = product_ids - cards.keys()
+    if missing:
+        products = [p async for p in card_queryset().filter(pk__in=missing)]
+        rendered = render_cards(products)
+        for entries, timeout in _entries(missing, rendered):
+            await cache.aset_many(entries, timeout=timeout)
+        cards.update(rendered)
+    return {pk: card for pk, card in cards.items() if card is not NO_CARD}
+
+
+def _found(product_ids, found):
+    return {pk: found[card_key(pk)] for pk in product_ids if card_key(pk) in found}
+
+
+def _entries(requested, rendered):
+    """
+    ``(entries, timeout)`` pairs to cache. Ids without a product are
+    remembered too, but only briefly: creating the product drops the marker
+    like any other card, except when it's created without signals.
+    """
+    found = {card_key(pk): card for pk, card in rendered.items()}
+    absent = {card_key(pk): NO_CARD for pk in requested if pk not in rendered}
+    return [
+        (entries, timeout)
+        for entries, timeout in (
+            (found, settings.PRODUCT_CARD_CACHE_TIMEOUT),
+            (absent, settings.PRODUCT_CARD_MISSING_TIMEOUT),
+        )
+        if entries
+    ]
+
+
+def with_absolute_urls(card, request):
+    image = card.get("primary_image")
+    if request is None or not image:
+        return card
+
+    def absolute(candidates):
+        return ", ".join(
+            request.build_absolute_uri(url) + " " + width
+            for url, width in (c.rsplit(" ", 1) for c in candidates.split(", "))
+        )
+
+    image = dict(
+        image,
+        image=request.build_absolute_uri(image["image"]) if image["image"] else None,
+        srcset={fmt: absolute(srcset) for fmt, srcset in image["srcset"].items()},
+    )
+    return dict(card, primary_image=image)
+
+
+def _as_list(data):
+    return list(data.all() if isinstance(data, BaseManager) else data)
+
+
+class ProductCardListSerializer(serializers.ListSerializer):
+    """
+    Renders a list of products from their cached cards; only the ids of the
+    listed products are used. Cards are cut down to the child's fields when
+    the client asked for a sparse fieldset.
+    """
+
+    def to_representation(self, data):
+        products = _as_list(data)
+        cards = get_cards([product.pk for product in products])
+        request = self.context.get("request")
+        names = list(self.child.fields)
+        return [
+            with_absolute_urls({name: cards[product.pk][name] for name in names}, request)
+            for product in products
+            if product.pk in cards
+        ]
+
+
+class ProductCardBatchListSerializer(serializers.ListSerializer):
+    """
+    Fetches the product cards of every row with one ``get_many`` before the
+    rows are rendered; ``ProductCardField`` then reads them from the context.
+    """
+
+    def get_product_ids(self, items):
+        fields = self.child.fields.values()
+        if not any(isinstance(field, ProductCardField) for field in fields):
+            return []
+        return [item.product_id for item in items]
+
+    def to_representation(self, data):
+        items = _as_list(data)
+        cards = self.context.setdefault("product_cards", {})
+        missing = set(self.get_product_ids(items)) - cards.keys()
+        if missing:
+            cards.update(get_cards(missing))
+        return super().to_representation(items)
+
+
+class ProductCardField(serializers.Field):
+    """
+    A product's card, by id. Reads batched cards from the context when a
+    ``ProductCardBatchListSerializer`` prepared them.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, product_id):
+        card = self.context.get("product_cards", {}).get(product_id)
+        if card is None:
+            card = get_cards([product_id]).get(product_id)
+        if card is None:
+            return None
+        return with_absolute_urls(card, self.context.get("request"))
@@ -0,0 +1,120 @@
+"""
+In-process snapshot of the category tree.
+
+Each worker keeps the tree it last loaded along with the tree version it was
+loaded at. ``Category`` writes bump the shared version in the cache, and the
+next lookup in every worker reloads the snapshot with one ordered scan.
+"""
+
+import json
+import threading
+from asgiref.sync import sync_to_async
+from .cache import aget_category_tree_version, get_category_tree_version
+from .models import Category
+
+
+class CategoryTree:
+    """
+    The whole tree, built from a single ``(tree_id, lft)`` ordered scan.
+
+    ``tree_json`` is the full-depth tree already rendered to JSON, so serving
+    it costs neither queries nor serialization.
+    """
+
+    fields = ("id", "parent_id", "name", "slug", "tree_id", "lft", "rght")
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.ranges = {}
+        self.nodes = {}
+        self.paths = {}
+        self.parents = {}
+        self.roots = []
+        self._ids_by_path = None
+
+        # Parents always precede their children in (tree_id, lft) order.
+        for row in rows:
+            node = {
+                "id": row["id"],
+                "name": row["name"],
+                "slug": row["slug"],
+                "subcategories": [],
+            }
+            self.nodes[row["id"]] = node
+            self.ranges[row["id"]] = (row["tree_id"], row["lft"], row["rght"])
+            self.parents[row["id"]] = row["parent_id"]
+            if row["parent_id"] is None:
+                self.roots.append(node)
+                self.paths[row["id"]] = (row["name"],)
+            else:
+                self.nodes[row["parent_id"]]["subcategories"].append(node)
+                self.paths[row["id"]] = self.paths[row["parent_id"]] + (row["name"],)
+
+        self.tree_json = json.dumps(self.roots, separators=(",", ":")).encode()
+
+    @classmethod
+    def load(cls, version):
+        rows = Category.objects.order_by("tree_id", "lft").values(*cls.fields)
+        return cls(version, list(rows))
+
+    def get_range(self, category_id):
+        """
+        ``(tree_id, lft, rght)`` of a category, or ``None`` if it doesn't exist.
+        """
+        return self.ranges.get(category_id)
+
+    def get_node(self, category_id):
+        return self.nodes.get(category_id)
+
+    def get_path(self, category_id):
+        """
+        Names from the root down to the category, e.g. ``("Electronics", "Laptops")``.
+        """
+        return self.paths.get(category_id)
+
+    def get_ancestors(self, category_id):
+        """
+        Ids of the category's ancestors, nearest first.
+        """
+        ancestors = []
+        parent_id = self.parents.get(category_id)
+        while parent_id is not None:
+            ancestors.append(parent_id)
+            parent_id = self.parents.get(parent_id)
+        return ancestors
+
+    def find_by_path(self, names):
+        """
+        Id of the category at a path of names (case-insensitive), or ``None``.
+        """
+        if self._ids_by_path is None:
+            self._ids_by_path = {
+                tuple(name.lower() for name in path): category_id
+                for category_id, path in self.paths.items()
+            }
+        return self._ids_by_path.get(tuple(name.lower() for name in names))
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_category_tree():
+    global _snapshot
+
+    version = get_category_tree_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = CategoryTree.load(version)
+            snapshot = _snapshot
+    return snapshot
+
+
+async def aget_category_tree():
+    version = await aget_category_tree_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    return await sync_to_async(get_category_tree)()
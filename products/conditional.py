@@ -0,0 +1,102 @@
+"""
+Conditional GET for catalog reads.
+
+Views compute a cheap validator before doing any work: a product's
+``updated_at`` for product detail, the catalog or category tree version for
+collections. ``If-None-Match``/``If-Modified-Since`` requests that still match
+get a 304 without touching the serializer.
+"""
+
+import hashlib
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .cache import get_catalog_version, get_category_tree_version, normalize_query
+
+
+def make_etag(request, stamp):
+    """
+    Strong ETag for ``stamp`` as seen through this URL, query and media type.
+    """
+    signature = "{}|{}{}?{}|{}".format(
+        stamp,
+        request.get_host(),
+        request.path,
+        normalize_query(request.query_params),
+        request.accepted_media_type,
+    )
+    return '"{}"'.format(hashlib.sha1(signature.encode()).hexdigest())
+
+
+def check_conditions(request, stamp, last_modified=None):
+    """
+    Evaluate the request's preconditions against a validator.
+
+    Returns ``(response, headers)``: ``response`` is the 304/412 to send as is,
+    or ``None`` to render normally and add ``headers`` to the result.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    validators = HttpResponse()
+    validators["ETag"] = make_etag(request, stamp)
+    if timestamp is not None:
+        validators["Last-Modified"] = http_date(timestamp)
+
+    response = get_conditional_response(
+        request,
+        etag=validators["ETag"],
+        last_modified=timestamp,
+        response=validators,
+    )
+    headers = {
+        header: validators[header]
+        for header in ("ETag", "Last-Modified")
+        if header in validators
+    }
+    return (None if response is validators else response), headers
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GETs with a 304 before the view renders anything.
+
+    Subclasses override ``get_validator`` and return the resource's version
+    stamp and, optionally, its last modification time; ``None`` (the default)
+    skips the check and the view is served as usual (e.g. the object doesn't
+    exist and the view will 404).
+    """
+
+    def get_validator(self, request, *args, **kwargs):
+        return None
+
+    def conditional_response(self, request, render, *args, **kwargs):
+        validator = self.get_validator(request, *args, **kwargs)
+        if validator is None:
+            return render()
+
+        response, headers = check_conditions(request, *validator)
+        if response is not None:
+            return response
+
+        response = render()
+        if response.status_code == 200:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            lambda: super(ConditionalGetMixin, self).get(request, *args, **kwargs),
+            *args,
+            **kwargs,
+        )
+
+
+class CatalogVersionConditionalMixin(ConditionalGetMixin):
+    def get_validator(self, request, *args, **kwargs):
+        return get_catalog_version(), None
+
+
+class CategoryTreeConditionalMixin(ConditionalGetMixin):
+    def get_validator(self, request, *args, **kwargs):
+        return get_category_tree_version(), None
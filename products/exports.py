@@ -0,0 +1,97 @@
+"""
+Streaming catalog export.
+
+Rows come straight from ``.values()`` over a server-side cursor
+(``.iterator(chunk_size=...)``) and are encoded one at a time, so memory use
+stays flat however large the catalog is.
+"""
+
+import csv
+import json
+from datetime import datetime, time, timezone as dt_timezone
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .categories import get_category_tree
+from .models import Product
+
+EXPORT_FIELDS = (
+    "id",
+    "slug",
+    "name",
+    "description",
+    "price",
+    "in_stock",
+    "category_path",
+    "primary_image_url",
+    "created_at",
+    "updated_at",
+)
+CATEGORY_PATH_SEPARATOR = " > "
+
+
+def parse_updated_since(value):
+    """
+    Parse an ISO 8601 date or datetime; naive values are taken as UTC.
+    """
+    if not value:
+        return None
+
+    updated_since = parse_datetime(value)
+    if updated_since is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError("Expected an ISO 8601 date or datetime.")
+        updated_since = datetime.combine(date, time.min)
+    if timezone.is_naive(updated_since):
+        updated_since = timezone.make_aware(updated_since, dt_timezone.utc)
+    return updated_since
+
+
+def export_queryset(updated_since=None):
+    queryset = Product.objects.order_by("pk")
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    return queryset.values(
+        "id",
+        "slug",
+        "name",
+        "description",
+        "price",
+        "in_stock",
+        "category_id",
+        "primary_image__image",
+        "created_at",
+        "updated_at",
+    )
+
+
+def iter_records(queryset, chunk_size=2000, image_url=default_storage.url):
+    tree = get_category_tree()
+    for row in queryset.iterator(chunk_size=chunk_size):
+        path = tree.get_path(row.pop("category_id"))
+        row["category_path"] = CATEGORY_PATH_SEPARATOR.join(path) if path else None
+        image = row.pop("primary_image__image")
+        row["primary_image_url"] = image_url(image) if image else None
+        yield row
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(records):
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for record in records:
+        yield writer.writerow(record)
+
+
+ENCODERS = {"ndjson": iter_ndjson, "csv": iter_csv}
@@ -0,0 +1,115 @@
+"""
+Facets for the product listing.
+
+``?facets=category,price`` (or ``?facets=all``) adds a ``facets`` block to the
+listing: per-category counts and a price histogram for the filtered products.
+Both come from one grouped query on ``(category, price bucket)``; category
+counts are then rolled up the tree from the in-process snapshot. Results are
+cached per catalog version and filter signature, so paging or reordering the
+same result set reuses them.
+"""
+
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+from rest_framework.exceptions import ParseError
+from .cache import get_catalog_version, normalize_query
+from .categories import get_category_tree
+
+FACETS_QUERY_PARAM = "facets"
+FACETS = ("category", "price")
+PRICE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000)
+
+# Parameters that don't change which products match, so paging, reordering
+# or trimming a result set reuses its facets.
+PRESENTATION_PARAMS = {
+    "page",
+    "page_size",
+    "cursor",
+    "pagination",
+    "count",
+    "ordering",
+    "fields",
+    "omit",
+    FACETS_QUERY_PARAM,
+}
+
+
+def requested_facets(request):
+    value = request.query_params.get(FACETS_QUERY_PARAM, "")
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    if "all" in names:
+        return FACETS
+    unknown = names - set(FACETS)
+    if unknown:
+        raise ParseError(f"Unknown facets: {', '.join(sorted(unknown))}.")
+    return tuple(name for name in FACETS if name in names)
+
+
+def facets_cache_key(request):
+    params = request.query_params.copy()
+    for name in PRESENTATION_PARAMS:
+        params.pop(name, None)
+    digest = hashlib.sha1(normalize_query(params).encode()).hexdigest()
+    return f"catalog:facets:{get_catalog_version()}:{digest}"
+
+
+def price_bucket():
+    return Case(
+        *(When(price__lt=bound, then=Value(i)) for i, bound in enumerate(PRICE_BUCKETS)),
+        default=Value(len(PRICE_BUCKETS)),
+        output_field=IntegerField(),
+    )
+
+
+def compute_facets(queryset):
+    """
+    Category and price facets of ``queryset`` from a single grouped query.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket())
+        .values("category_id", "price_bucket")
+        .annotate(count=Count("pk"))
+    )
+
+    tree = get_category_tree()
+    category_counts = {}
+    bucket_counts = [0] * (len(PRICE_BUCKETS) + 1)
+    for row in rows:
+        bucket_counts[row["price_bucket"]] += row["count"]
+        category_id = row["category_id"]
+        if category_id is None or tree.get_node(category_id) is None:
+            continue
+        for node_id in [category_id] + tree.get_ancestors(category_id):
+            category_counts[node_id] = category_counts.get(node_id, 0) + row["count"]
+
+    # Snapshot order is tree order, so parents precede their children.
+    categories = [
+        {
+            "id": category_id,
+            "name": node["name"],
+            "slug": node["slug"],
+            "parent": tree.parents[category_id],
+            "count": category_counts[category_id],
+        }
+        for category_id, node in tree.nodes.items()
+        if category_id in category_counts
+    ]
+
+    bounds = (None,) + PRICE_BUCKETS + (None,)
+    price = [
+        {"min": bounds[i], "max": bounds[i + 1], "count": count}
+        for i, count in enumerate(bucket_counts)
+    ]
+    return {"category": categories, "price": price}
+
+
+def get_facets(queryset, request, names):
+    key = facets_cache_key(request)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return {name: facets[name] for name in names}
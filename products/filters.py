@@ -1,20 +1,83 @@
 from django_filters import rest_framework as filters
 from django.db.models import Q
-from .models import Product, Category
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.settings import api_settings
+from .models import Product, ProductReview
+from .categories import get_category_tree
+from .search import search_backend
 
 
 class ProductFilter(filters.FilterSet):
     category = filters.CharFilter(method="filter_by_category")
     price = filters.RangeFilter()
+    in_stock = filters.BooleanFilter(method="filter_in_stock")
 
     class Meta:
         model = Product
-        fields = ("category", "price")
+        fields = ("category", "price", "in_stock")
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(in_stock__gt=0)
+        return queryset.filter(in_stock=0)
 
     def filter_by_category(self, queryset, name, value):
         try:
-            category = Category.objects.get(id=value)
-            categories = category.get_descendants(include_self=True)
-            return queryset.filter(category__in=categories)
-        except Category.DoesNotExist:
+            category_range = get_category_tree().get_range(int(value))
+        except ValueError:
+            category_range = None
+        if category_range is None:
             return queryset.none()
+
+        # The category and all of its descendants, as one range join.
+        tree_id, lft, rght = category_range
+        return queryset.filter(
+            category__tree_id=tree_id, category__lft__gte=lft, category__rght__lte=rght
+        )
+
+
+class ProductReviewFilter(filters.FilterSet):
+    verified = filters.BooleanFilter(field_name="is_verified")
+
+    class Meta:
+        model = ProductReview
+        fields = ("verified",)
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    ``OrderingFilter`` that maps public ordering names onto stored columns.
+    """
+
+    ordering_aliases = {"rating": "rating_average"}
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+
+        resolved = []
+        for field in ordering:
+            prefix = "-" if field.startswith("-") else ""
+            name = field.lstrip("-")
+            resolved.append(prefix + self.ordering_aliases.get(name, name))
+        return resolved
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Full-text search over the maintained product search document.
+
+    Results are ranked by relevance unless the client asks for an explicit
+    ``ordering``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        queryset = search_backend().search(queryset, " ".join(terms))
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by("-search_rank", *queryset.query.order_by)
+        return queryset
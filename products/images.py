@@ -0,0 +1,206 @@
+"""
+Image variant pipeline.
+
+Uploads only store the original ``ProductImage`` (``variants_status`` is
+``pending``). A worker (``process_image_variants``) claims pending images and
+renders fixed-width thumbnails in WebP (and AVIF when Pillow supports it) in a
+process pool; the parent process does all storage and database work. Images
+whose worker died mid-batch stay ``processing`` until their claim goes stale
+(``IMAGE_VARIANTS_CLAIM_TIMEOUT``), then the next worker takes them over.
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+from .cache import bump_catalog_version, invalidate_product_cards
+from .models import Product, ProductImage, ProductImageVariant, VariantStatus
+
+logger = logging.getLogger(__name__)
+
+
+def _avif_supported():
+    # Pillow only knows the "avif" module from 11.2 on; older ones raise.
+    try:
+        return features.check_module("avif")
+    except ValueError:
+        return False
+
+
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+VARIANT_FORMATS = ("avif", "webp") if _avif_supported() else ("webp",)
+VARIANT_QUALITY = {"webp": 80, "avif": 60}
+
+
+def render_variants(data, widths=VARIANT_WIDTHS, formats=VARIANT_FORMATS):
+    """
+    Render every variant of one image. Pure function of the original's bytes,
+    so it can run in a worker process.
+    """
+    with Image.open(BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA" if "A" in original.getbands() else "RGB")
+
+        # Never upscale; images narrower than the smallest width get one
+        # variant at their own size.
+        sizes = [width for width in widths if width < original.width]
+        sizes = sizes or [original.width]
+
+        variants = []
+        for width in sizes:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                buffer = BytesIO()
+                resized.save(buffer, fmt.upper(), quality=VARIANT_QUALITY[fmt])
+                variants.append(
+                    {
+                        "name": f"w{width}",
+                        "format": fmt,
+                        "width": width,
+                        "height": height,
+                        "content": buffer.getvalue(),
+                    }
+                )
+        return variants
+
+
+def stale_claims():
+    """
+    Images left ``processing`` by a worker that has presumably died.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.IMAGE_VARIANTS_CLAIM_TIMEOUT)
+    return Q(variants_status=VariantStatus.processing) & (
+        Q(variants_claimed_at__lt=cutoff) | Q(variants_claimed_at__isnull=True)
+    )
+
+
+def claim_pending_images(limit):
+    """
+    Mark up to ``limit`` pending (or abandoned) images as processing and
+    return them. Concurrent workers skip each other's rows where the database
+    allows it.
+    """
+    with transaction.atomic():
+        images = list(
+            ProductImage.objects.select_for_update(skip_locked=True)
+            .filter(Q(variants_status=VariantStatus.pending) | stale_claims())
+            .order_by("pk")[:limit]
+        )
+        ProductImage.objects.filter(pk__in=[image.pk for image in images]).update(
+            variants_status=VariantStatus.processing,
+            variants_claimed_at=timezone.now(),
+        )
+        if images:
+            _variants_changed({image.product_id for image in images})
+    return images
+
+
+def store_variants(image, variants):
+    stem = os.path.splitext(os.path.basename(image.image.name))[0]
+    objs = []
+    for variant in variants:
+        obj = ProductImageVariant(
+            image=image,
+            name=variant["name"],
+            format=variant["format"],
+            width=variant["width"],
+            height=variant["height"],
+            file_size=len(variant["content"]),
+        )
+        obj.file.save(
+            f"{stem}-{variant['name']}.{variant['format']}",
+            ContentFile(variant["content"]),
+            save=False,
+        )
+        objs.append(obj)
+
+    storage = ProductImageVariant.file.field.storage
+    try:
+        with transaction.atomic():
+            # The image may have been deleted while it was rendering.
+            current = ProductImage.objects.select_for_update().filter(pk=image.pk)
+            if not current.exists():
+                raise ProductImage.DoesNotExist(f"Product image {image.pk} is gone")
+            replaced = ProductImageVariant.objects.filter(image=image)
+            replaced_files = [variant.file.name for variant in replaced.only("file")]
+            replaced.delete()
+            ProductImageVariant.objects.bulk_create(objs)
+            ProductImage.objects.filter(pk=image.pk).update(
+                variants_status=VariantStatus.ready
+            )
+            Product.objects.filter(pk=image.product_id).update(
+                updated_at=timezone.now()
+            )
+    except Exception:
+        for obj in objs:
+            storage.delete(obj.file.name)
+        raise
+    # New files never reuse a name (the storage suffixes clashes), so only
+    # the old renditions go.
+    for name in replaced_files:
+        storage.delete(name)
+    invalidate_product_cards([image.product_id])
+
+
+def read_original(image):
+    with image.image.open("rb") as f:
+        return f.read()
+
+
+def process_images(images, workers=None):
+    """
+    Render and store variants for ``images``. Returns ``(ready, failed)``.
+    """
+    ready = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for image in images:
+            try:
+                futures[pool.submit(render_variants, read_original(image))] = image
+            except OSError:
+                logger.exception("Cannot read original of product image %s", image.pk)
+                _mark_failed(image)
+                failed += 1
+
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                store_variants(image, future.result())
+                ready += 1
+            except Exception:
+                logger.exception("Cannot render variants of product image %s", image.pk)
+                _mark_failed(image)
+                failed += 1
+
+    if ready:
+        bump_catalog_version()
+    return ready, failed
+
+
+def _mark_failed(image):
+    with transaction.atomic():
+        ProductImage.objects.filter(pk=image.pk).update(
+            variants_status=VariantStatus.failed
+        )
+        _variants_changed([image.product_id])
+
+
+def _variants_changed(product_ids):
+    # ``variants_status`` is part of the cached cards and the detail payload.
+    product_ids = list(product_ids)
+    Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+
+    def invalidate():
+        invalidate_product_cards(product_ids)
+        bump_catalog_version()
+
+    transaction.on_commit(invalidate)
@@ -0,0 +1,184 @@
+"""
+Streaming bulk import of products from CSV or JSON Lines.
+
+Rows are read lazily, validated a chunk at a time against the model fields'
+own validators, and written with one ``bulk_create`` per chunk: rows carrying a
+``slug`` are upserted on it, the others get slugs allocated for the whole
+chunk up front. Memory use depends on the batch size, not the file size.
+"""
+
+import csv
+import json
+import time
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .cache import bump_catalog_version, invalidate_product_cards
+from .categories import get_category_tree
+from .models import Product
+from .search import search_backend
+from .utils import allocate_slugs
+
+CATEGORY_PATH_SEPARATOR = ">"
+IMPORT_FIELDS = ("name", "description", "price", "in_stock")
+UPDATE_FIELDS = IMPORT_FIELDS + ("category", "updated_at")
+
+
+def read_rows(stream, file_format):
+    """
+    Yield ``(line_number, row)`` pairs from an open text stream.
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = exc
+        yield line_number, row
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.rejected = 0
+        self.started = time.monotonic()
+
+    @property
+    def processed(self):
+        return self.created + self.updated + self.rejected
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+
+class ProductImporter:
+    def __init__(self, owner, batch_size=1000, rejects=None, progress=None):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.rejects = rejects
+        self.progress = progress
+        self.categories = get_category_tree()
+        self.fields = {name: Product._meta.get_field(name) for name in IMPORT_FIELDS}
+        self.slug_field = Product._meta.get_field("slug")
+
+    def run(self, rows):
+        result = ImportResult()
+        batch = []
+        for line_number, row in rows:
+            batch.append((line_number, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch, result)
+                batch = []
+        if batch:
+            self.import_batch(batch, result)
+        return result
+
+    def import_batch(self, batch, result):
+        upserts, inserts = {}, []
+        for line_number, row in batch:
+            try:
+                product = self.build_product(row)
+            except ValidationError as exc:
+                self.reject(line_number, row, exc, result)
+                continue
+            if product.slug:
+                # The last row wins when a slug repeats within a batch.
+                upserts[product.slug] = product
+            else:
+                inserts.append(product)
+
+        with transaction.atomic():
+            if upserts:
+                existing = set(
+                    Product.objects.filter(slug__in=upserts).values_list(
+                        "slug", flat=True
+                    )
+                )
+                Product.objects.bulk_create(
+                    upserts.values(),
+                    update_conflicts=True,
+                    unique_fields=["slug"],
+                    update_fields=UPDATE_FIELDS,
+                )
+                result.updated += len(existing)
+                result.created += len(upserts) - len(existing)
+
+            if inserts:
+                allocate_slugs(inserts)
+                Product.objects.bulk_create(inserts)
+                result.created += len(inserts)
+
+            slugs = list(upserts) + [product.slug for product in inserts]
+            written = Product.objects.filter(slug__in=slugs)
+            search_backend().index(written)
+
+        # New ids may have been looked up (and remembered as missing) before.
+        invalidate_product_cards(written.values_list("pk", flat=True))
+        bump_catalog_version()
+        if self.progress:
+            self.progress(result)
+
+    def build_product(self, row):
+        if not isinstance(row, dict):
+            raise ValidationError({"row": [f"Unreadable row: {row}"]})
+
+        values, errors = {}, {}
+        for name, field in self.fields.items():
+            raw = row.get(name)
+            if isinstance(raw, str):
+                raw = raw.strip()
+            try:
+                values[name] = field.clean(raw, None)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+
+        slug = (row.get("slug") or "").strip()
+        if slug:
+            try:
+                self.slug_field.clean(slug, None)
+            except ValidationError as exc:
+                errors["slug"] = exc.messages
+
+        category = row.get("category")
+        if category not in (None, ""):
+            values["category_id"] = self.resolve_category(category)
+            if values["category_id"] is None:
+                errors["category"] = [f"Unknown category: {category}"]
+
+        if errors:
+            raise ValidationError(errors)
+        return Product(added_by=self.owner, slug=slug, **values)
+
+    def resolve_category(self, value):
+        """
+        Accept a category id or a path such as ``Electronics > Laptops``.
+        """
+        if isinstance(value, int) or str(value).strip().isdigit():
+            category_id = int(value)
+            return category_id if self.categories.get_node(category_id) else None
+
+        names = [name.strip() for name in str(value).split(CATEGORY_PATH_SEPARATOR)]
+        return self.categories.find_by_path(names)
+
+    def reject(self, line_number, row, exc, result):
+        result.rejected += 1
+        if self.rejects is None:
+            return
+        record = {
+            "line": line_number,
+            "row": row if isinstance(row, dict) else None,
+            "errors": exc.message_dict if hasattr(exc, "error_dict") else exc.messages,
+        }
+        self.rejects.write(json.dumps(record, default=str) + "\n")
@@ -0,0 +1,77 @@
+"""
+A small closed-loop HTTP load generator for comparing server modes.
+
+Each of ``concurrency`` clients keeps one connection open and sends the next
+request as soon as the previous response is read, for ``duration`` seconds.
+"""
+
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class LoadResult:
+    def __init__(self, url, latencies, errors, elapsed):
+        self.url = url
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def rate(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        if len(self.latencies) == 1:
+            return self.latencies[0]
+        return statistics.quantiles(self.latencies, n=100, method="inclusive")[p - 1]
+
+
+def run_load(url, concurrency=16, duration=10.0, headers=None):
+    parts = urlsplit(url)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    connection_class = (
+        http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    )
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        connection = connection_class(parts.netloc, timeout=30)
+        own_latencies, own_errors = [], 0
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                connection.request("GET", path, headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    own_errors += 1
+                    continue
+                own_latencies.append(time.monotonic() - started)
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                connection.close()
+                connection = connection_class(parts.netloc, timeout=30)
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return LoadResult(url, latencies, sum(errors), time.monotonic() - started)
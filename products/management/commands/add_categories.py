@@ -1,31 +1,43 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from products.models import Category
 from pathlib import Path
-import json, os
+import json
 
 
 class Command(BaseCommand):
-    help = "Adds predefined categories and subcategories to the database"
+    help = (
+        "Adds predefined categories and subcategories to the database, or "
+        "re-syncs the tree with an updated file"
+    )
 
-    def handle(self, *args, **kwargs):
-        categories_json = open(Path(__file__).with_name("categories.json"), "r").read()
-        categories = json.loads(categories_json)
-
-        def create_category(name, parent=None):
-            category, _ = Category.objects.create(name=name, parent=parent)
-            return category
-
-        def add_categories(category_dict, parent=None):
-            for name, subcategories in category_dict.items():
-                category = create_category(name, parent)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            default=Path(__file__).with_name("categories.json"),
+            help="JSON taxonomy of nested category names (defaults to categories.json)",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete categories that are no longer in the file",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
 
-                if isinstance(subcategories, dict):
-                    add_categories(subcategories, category)
-                elif isinstance(subcategories, list):
-                    for subcategory in subcategories:
-                        create_category(subcategory, category)
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        try:
+            with open(options["file"]) as f:
+                categories = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {options['file']}: {exc}")
 
-        add_categories(categories)
+        result = Category.objects.sync_tree(
+            categories, prune=options["prune"], batch_size=options["batch_size"]
+        )
         self.stdout.write(
-            self.style.SUCCESS("Successfully added categories and subcategories.")
+            self.style.SUCCESS(
+                f"Categories synced in {result.elapsed:.2f}s: {result.created} "
+                f"created, {result.updated} renumbered, {result.deleted} deleted."
+            )
         )
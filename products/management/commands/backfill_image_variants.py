@@ -0,0 +1,46 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from products.images import stale_claims
+from products.models import ProductImage, VariantStatus
+
+
+class Command(BaseCommand):
+    help = "Queues existing product images for variant rendering and processes them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render images that already have variants too",
+        )
+        parser.add_argument(
+            "--enqueue-only",
+            action="store_true",
+            help="Only queue the images, leaving them to a running worker",
+        )
+        parser.add_argument("--workers", type=int, default=None)
+
+    def handle(self, *args, **options):
+        # Images a live worker is on are left alone; abandoned ones are requeued.
+        images = ProductImage.objects.filter(
+            ~Q(variants_status=VariantStatus.processing) | stale_claims()
+        )
+        if not options["all"]:
+            images = images.filter(
+                Q(variants_status__in=[VariantStatus.failed, VariantStatus.processing])
+                | Q(variants__isnull=True)
+            ).distinct()
+
+        queued = ProductImage.objects.filter(pk__in=images.values("pk")).update(
+            variants_status=VariantStatus.pending
+        )
+        self.stdout.write(f"Queued {queued} image(s).")
+
+        if not options["enqueue_only"]:
+            call_command(
+                "process_image_variants",
+                "--once",
+                workers=options["workers"],
+                stdout=self.stdout,
+            )
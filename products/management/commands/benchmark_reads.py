@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.loadtest import run_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests catalog read endpoints of a running server, e.g. to compare "
+        "the WSGI and ASGI worker modes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", metavar="URL")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per URL")
+        parser.add_argument(
+            "--header",
+            action="append",
+            default=[],
+            metavar="NAME:VALUE",
+            help="Extra request header, e.g. an Authorization token",
+        )
+
+    def handle(self, *args, **options):
+        headers = {}
+        for header in options["header"]:
+            name, sep, value = header.partition(":")
+            if not sep:
+                raise CommandError(f"Invalid header: {header}")
+            headers[name.strip()] = value.strip()
+
+        self.stdout.write(
+            f"{'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}  url"
+        )
+        for url in options["urls"]:
+            result = run_load(
+                url,
+                concurrency=options["concurrency"],
+                duration=options["duration"],
+                headers=headers,
+            )
+            self.stdout.write(
+                f"{result.rate:9.1f} {result.percentile(50) * 1000:8.1f} "
+                f"{result.percentile(95) * 1000:8.1f} {result.percentile(99) * 1000:8.1f} "
+                f"{result.errors:7d}  {url}"
+            )
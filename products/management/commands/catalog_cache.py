@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from products.cache import bump_catalog_version, get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Shows catalog response cache hit/miss counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the hit/miss counters"
+        )
+        parser.add_argument(
+            "--invalidate",
+            action="store_true",
+            help="Bump the catalog version, orphaning every cached response",
+        )
+
+    def handle(self, *args, **options):
+        if options["invalidate"]:
+            version = bump_catalog_version()
+            self.stdout.write(f"Catalog version bumped to {version}.")
+
+        stats = get_cache_stats()
+        self.stdout.write(
+            "version={version} hits={hits} misses={misses} hit_ratio={ratio:.2%}".format(
+                ratio=stats["hit_ratio"], **stats
+            )
+        )
+
+        if options["reset"]:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,57 @@
+from urllib.parse import urlencode
+from django.core.management.base import BaseCommand, CommandError
+from products.queryplans import CHECKED_TABLES, check_query_plans, seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN on the SQL of each catalog endpoint and fails if a plan "
+        "reads a large table with a sequential scan"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            metavar="N",
+            help="First top the catalog up to N generated products "
+            "(never run against production data)",
+        )
+        parser.add_argument(
+            "--table",
+            action="append",
+            dest="tables",
+            help=f"Table that must not be scanned (default: {', '.join(CHECKED_TABLES)})",
+        )
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            created = seed_catalog(options["seed"])
+            self.stdout.write(f"Seeded {created} product(s).")
+
+        tables = tuple(options["tables"] or CHECKED_TABLES)
+        reports = check_query_plans(tables=tables)
+
+        failed = []
+        for report in reports:
+            url = report.path + ("?" + urlencode(report.params) if report.params else "")
+            style = self.style.SUCCESS if report.ok else self.style.ERROR
+            self.stdout.write(style(f"{'ok' if report.ok else 'FAIL':4} {report.label}: {url}"))
+            if report.status != 200:
+                self.stdout.write(f"     status {report.status}")
+
+            for sql, plan, scans in report.queries:
+                if scans or options["verbosity"] > 1:
+                    self.stdout.write(f"     {sql}")
+                    for line in plan:
+                        self.stdout.write(f"       {line}")
+            if not report.ok:
+                failed.append(report.label)
+
+        if failed:
+            raise CommandError(
+                f"{len(failed)} endpoint(s) fell back to a sequential scan or "
+                f"failed: {', '.join(failed)}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"All {len(reports)} query plans use indexes."))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.exports import ENCODERS, export_queryset, iter_records, parse_updated_since
+import sys
+
+
+class Command(BaseCommand):
+    help = "Exports the product catalog as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=sorted(ENCODERS), default="ndjson", help="Output format"
+        )
+        parser.add_argument(
+            "--output", help="File to write to (standard output by default)"
+        )
+        parser.add_argument(
+            "--updated-since",
+            help="Only export products changed since this ISO date or datetime",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            updated_since = parse_updated_since(options["updated_since"])
+        except ValueError as exc:
+            raise CommandError(f"--updated-since: {exc}")
+
+        records = iter_records(
+            export_queryset(updated_since), chunk_size=options["chunk_size"]
+        )
+        output = (
+            open(options["output"], "w", newline="", encoding="utf-8")
+            if options["output"]
+            else sys.stdout
+        )
+        count = 0
+        try:
+            for line in ENCODERS[options["format"]](records):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if options["output"]:
+            if options["format"] == "csv":
+                count -= 1
+            self.stderr.write(
+                self.style.SUCCESS(f"Exported {count} products to {options['output']}.")
+            )
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.imports import ProductImporter, read_rows
+from users.models import CustomUser as User
+from pathlib import Path
+
+
+class Command(BaseCommand):
+    help = "Imports products from a CSV or JSON Lines file in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON Lines file to import")
+        parser.add_argument(
+            "--owner",
+            required=True,
+            help="Username of the manager recorded as adding new products",
+        )
+        parser.add_argument(
+            "--format",
+            choices=("csv", "jsonl"),
+            help="Input format (guessed from the file extension by default)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--rejects",
+            help="Write rejected rows and their errors to this JSON Lines file",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        file_format = options["format"] or (
+            "csv" if path.suffix.lower() == ".csv" else "jsonl"
+        )
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['owner']}")
+
+        rejects = open(options["rejects"], "w") if options["rejects"] else None
+        try:
+            with open(path, newline="", encoding="utf-8") as stream:
+                importer = ProductImporter(
+                    owner,
+                    batch_size=options["batch_size"],
+                    rejects=rejects,
+                    progress=self.report,
+                )
+                result = importer.run(read_rows(stream, file_format))
+        finally:
+            if rejects:
+                rejects.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.processed} rows in {result.elapsed:.1f}s "
+                f"({result.rate:.0f} rows/s): {result.created} created, "
+                f"{result.updated} updated, {result.rejected} rejected."
+            )
+        )
+
+    def report(self, result):
+        self.stdout.write(
+            f"{result.processed} rows processed ({result.rate:.0f} rows/s)"
+        )
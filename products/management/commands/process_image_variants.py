@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from products.images import claim_pending_images, process_images
+import time
+
+
+class Command(BaseCommand):
+    help = "Renders thumbnails and WebP/AVIF variants for pending product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Size of the process pool"
+        )
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait between polls when the queue is empty",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the queue and exit"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            images = claim_pending_images(options["batch_size"])
+            if images:
+                ready, failed = process_images(images, workers=options["workers"])
+                self.stdout.write(f"{ready} image(s) processed, {failed} failed.")
+                continue
+
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
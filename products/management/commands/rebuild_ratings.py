@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Rebuilds product rating aggregates from reviews and reports drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report drift, and exit with an error if any is found",
+        )
+
+    def handle(self, *args, **options):
+        drifted = rebuild_rating_aggregates(dry_run=options["check"])
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Rating aggregates are up to date."))
+            return
+
+        ids = ", ".join(str(pk) for pk in drifted[:20])
+        if len(drifted) > 20:
+            ids += ", ..."
+        if options["check"]:
+            raise CommandError(f"{len(drifted)} product(s) have drifted: {ids}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt rating aggregates of {len(drifted)} product(s): {ids}")
+        )
@@ -1,14 +1,26 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 from django.dispatch import receiver
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (
     MinLengthValidator,
     MaxLengthValidator,
     MinValueValidator,
 )
+from mptt.managers import TreeManager
 from mptt.models import MPTTModel, TreeForeignKey
+from mptt.signals import node_moved
 from users.models import CustomUser as User
-from .utils import unique_slugify
+from .utils import unique_slugify, save_with_unique_slug
+from .search import search_backend
+from .taxonomy import sync_category_tree
+from .cache import (
+    bump_catalog_version,
+    bump_category_tree_version,
+    invalidate_product_cards,
+)
 from decimal import Decimal
 
 
@@ -26,10 +38,54 @@ class Product(models.Model):
     category = models.ForeignKey(
         "Category", related_name="products", on_delete=models.SET_NULL, null=True
     )
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Review aggregates, maintained incrementally by ``products.ratings``.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.DecimalField(
+        max_digits=3, decimal_places=2, default=0, editable=False
+    )
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # The image shown on product cards, maintained by ``ProductImage``.
+    primary_image = models.ForeignKey(
+        "ProductImage",
+        related_name="+",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    class Meta:
+        # Each index backs one listing order (with the ``id`` tie-breaker the
+        # cursor pagination appends), alone or within a category.
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="product_created_idx"),
+            models.Index(fields=["price", "id"], name="product_price_idx"),
+            models.Index(fields=["rating_average", "id"], name="product_rating_idx"),
+            models.Index(
+                fields=["category", "-created_at"], name="product_category_created_idx"
+            ),
+            models.Index(fields=["category", "price"], name="product_category_price_idx"),
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(in_stock__gt=0),
+                name="product_in_stock_created_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        save_with_unique_slug(self, super().save, *args, **kwargs)
+
 
 @receiver(pre_save, sender=Product)
 def set_product_slug(sender, instance, *args, **kwargs):
@@ -37,12 +93,36 @@ def set_product_slug(sender, instance, *args, **kwargs):
         unique_slugify(instance)
 
 
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, *args, **kwargs):
+    if update_fields and not {"name", "description"} & set(update_fields):
+        return
+    search_backend().index(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, *args, **kwargs):
+    search_backend().remove([instance.pk])
+
+
+VariantStatus = models.TextChoices("VariantStatus", "pending processing ready failed")
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(
         Product, related_name="images", on_delete=models.CASCADE
     )
     image = models.ImageField(upload_to="products/")
     is_primary = models.BooleanField(default=False)
+    variants_status = models.CharField(
+        max_length=20,
+        choices=VariantStatus.choices,
+        default=VariantStatus.pending,
+        db_index=True,
+    )
+    # When a worker took the image for processing; claims older than
+    # ``IMAGE_VARIANTS_CLAIM_TIMEOUT`` are presumed dead and taken over.
+    variants_claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self) -> str:
         return self.product.name
@@ -53,6 +133,59 @@ class ProductImage(models.Model):
                 is_primary=False
             )
         super().save(*args, **kwargs)
+        refresh_primary_image(self.product_id)
+
+
+def refresh_primary_image(product_id):
+    """
+    Point ``Product.primary_image`` at the image flagged as primary, or at
+    the first uploaded image if none is.
+    """
+    first_image = ProductImage.objects.filter(product=OuterRef("pk")).order_by(
+        "-is_primary", "pk"
+    )
+    Product.objects.filter(pk=product_id).update(
+        primary_image=Subquery(first_image.values("pk")[:1]),
+        updated_at=timezone.now(),
+    )
+    transaction.on_commit(lambda: invalidate_product_cards([product_id]))
+
+
+@receiver(post_delete, sender=ProductImage)
+def replace_deleted_primary_image(sender, instance, *args, **kwargs):
+    refresh_primary_image(instance.product_id)
+
+
+class ProductImageVariant(models.Model):
+    """
+    A resized/re-encoded rendition of a ``ProductImage``, produced off the
+    request path by ``products.images``.
+    """
+
+    image = models.ForeignKey(
+        ProductImage, related_name="variants", on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=50)
+    format = models.CharField(max_length=10)
+    file = models.ImageField(upload_to="products/variants/")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    file_size = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ("image", "name", "format")
+
+    def __str__(self) -> str:
+        return f"{self.image} ({self.name}.{self.format})"
+
+
+class CategoryManager(TreeManager):
+    def sync_tree(self, taxonomy, prune=False, batch_size=1000):
+        """
+        Bulk load or re-sync the tree from a nested mapping of names; see
+        ``products.taxonomy``.
+        """
+        return sync_category_tree(taxonomy, prune=prune, batch_size=batch_size)
 
 
 class Category(MPTTModel):
@@ -62,15 +195,21 @@ class Category(MPTTModel):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, db_index=True)
 
+    objects = CategoryManager()
+
     class Meta:
         verbose_name_plural = "Categories"
+        indexes = [
+            models.Index(
+                fields=["tree_id", "lft", "rght"], name="category_tree_range_idx"
+            ),
+        ]
 
     class MPTTMeta:
         order_insertion_by = ["name"]
 
     def save(self, *args, **kwargs):
-        unique_slugify(self)
-        super(Category, self).save(*args, **kwargs)
+        save_with_unique_slug(self, super(Category, self).save, *args, **kwargs)
 
     def __str__(self) -> str:
         return self.name
@@ -78,8 +217,12 @@ class Category(MPTTModel):
 
 @receiver(pre_save, sender=Category)
 def set_category_slug(sender, instance, *args, **kwargs):
-    if instance.pk is None:
-        unique_slugify(instance)
+    unique_slugify(instance)
+
+
+@receiver([post_save, post_delete, node_moved], sender=Category)
+def invalidate_category_tree(sender, *args, **kwargs):
+    transaction.on_commit(bump_category_tree_version)
 
 
 class ProductReview(models.Model):
@@ -93,5 +236,38 @@ class ProductReview(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # One per review listing order, so a page is a bounded range scan
+        # within the product however many reviews it has.
+        indexes = [
+            models.Index(
+                fields=["product", "-created_at", "-id"],
+                name="review_product_created_idx",
+            ),
+            models.Index(
+                fields=["product", "rating", "id"], name="review_product_rating_idx"
+            ),
+            models.Index(
+                fields=["product", "-created_at", "-id"],
+                condition=models.Q(is_verified=True),
+                name="review_verified_created_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - {self.rating}* - {self.comment}"
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete, node_moved], sender=Category)
+def invalidate_catalog_cache(sender, *args, **kwargs):
+    # After commit, or a read in between would cache the old rows under the
+    # new version.
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_card(sender, instance, *args, **kwargs):
+    product_ids = [instance.pk]
+    transaction.on_commit(lambda: invalidate_product_cards(product_ids))
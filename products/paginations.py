@@ -1,7 +1,272 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from urllib import parse
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset ("seek") pagination over a composite sort key.
+
+    The cursor stores the full sort key of the boundary row (with ``id`` as a
+    tie-breaker), so each page is a bounded index range scan no matter how deep
+    the client pages, and no ``COUNT(*)`` is ever run.
+    """
+
+    page_size = 16
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at",)
+    tie_breaker = "id"
+    # Model fields a cursor may be positioned on.
+    cursor_fields = ("created_at", "id")
+    # Annotations it may be positioned on, when the queryset has them.
+    cursor_annotations = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        return self.set_page([obj async for obj in queryset])
+
+    def page_queryset(self, queryset, request, view):
+        """
+        The query for the requested page, plus one row to tell if there is more.
+        """
+        self.request = request
+        self.model = queryset.model
+        self.annotations = queryset.query.annotations
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = _invert(self.ordering) if reverse else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self._seek(ordering))
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        reverse = self.cursor is not None and self.cursor.reverse
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(queryset.query.order_by) or list(self.ordering)
+        allowed = self.cursor_fields + tuple(
+            name for name in self.cursor_annotations if name in queryset.query.annotations
+        )
+        for field in ordering:
+            if field.lstrip("-") not in allowed:
+                raise ParseError(
+                    f"Cursor pagination does not support ordering by '{field.lstrip('-')}'."
+                )
+
+        if ordering[-1].lstrip("-") != self.tie_breaker:
+            prefix = "-" if ordering[-1].startswith("-") else ""
+            ordering.append(prefix + self.tie_breaker)
+        return tuple(ordering)
+
+    def _seek(self, ordering):
+        """
+        Build ``(a, b) > (x, y)`` as ``a > x OR (a = x AND b > y)``.
+        """
+        condition, equal = Q(), {}
+        for field, value in zip(ordering, self.cursor.position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+            values = tokens["p"]
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        position = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            try:
+                if name in self.annotations:
+                    model_field = self.annotations[name].output_field
+                else:
+                    model_field = self.model._meta.get_field(name)
+                position.append(model_field.to_python(value))
+            except (FieldDoesNotExist, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return _Cursor(reverse, position)
+
+    def encode_cursor(self, reverse, instance):
+        tokens = {"p": [str(getattr(instance, f.lstrip("-"))) for f in self.ordering]}
+        if reverse:
+            tokens["r"] = "1"
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def get_html_context(self):
+        return {
+            "previous_url": self.get_previous_link(),
+            "next_url": self.get_next_link(),
+        }
+
+
+class _Cursor:
+    def __init__(self, reverse, position):
+        self.reverse = reverse
+        self.position = position
+
+
+def _invert(ordering):
+    return tuple(f[1:] if f.startswith("-") else "-" + f for f in ordering)
+
+
+class ProductCursorPagination(KeysetPagination):
+    cursor_fields = ("created_at", "price", "rating_average", "id")
+    # Search results are ordered by relevance first.
+    cursor_annotations = ("search_rank",)
+
+
+class ReviewCursorPagination(KeysetPagination):
+    page_size = 20
+    cursor_fields = ("created_at", "rating", "id")
+
+
+class _UncountedPage:
+    """
+    Just enough of ``django.core.paginator.Page`` to build page links without
+    knowing the total number of pages.
+    """
+
+    def __init__(self, object_list, number, has_next):
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
 
 
 class ProductPagination(PageNumberPagination):
+    """
+    Page number pagination for the catalog, with two cheaper opt-in modes:
+
+    - ``?pagination=cursor`` (or any ``?cursor=``) switches to keyset pagination.
+    - ``?count=false`` keeps page numbers but skips the ``COUNT(*)``.
+    """
+
     page_size = 16
     page_size_query_param = "page_size"
     max_page_size = 100
+    pagination_query_param = "pagination"
+    count_query_param = "count"
+    cursor_pagination_class = ProductCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor_paginator = None
+        self.counted = True
+
+        if self.wants_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+        if request.query_params.get(self.count_query_param, "").lower() in (
+            "0",
+            "false",
+        ):
+            self.counted = False
+            return self.paginate_uncounted(queryset, request)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def wants_cursor(self, request):
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+        return (
+            cursor_param in request.query_params
+            or request.query_params.get(self.pagination_query_param) == "cursor"
+        )
+
+    def paginate_uncounted(self, queryset, request):
+        page_size = self.get_page_size(request)
+        try:
+            number = int(request.query_params.get(self.page_query_param) or 1)
+            if number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (number - 1) * page_size
+        results = list(queryset[offset : offset + page_size + 1])
+        if not results and number != 1:
+            raise NotFound(self.invalid_page_message)
+
+        self.page = _UncountedPage(
+            results[:page_size], number, has_next=len(results) > page_size
+        )
+        return self.page.object_list
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        if not self.counted:
+            return Response(
+                {
+                    "count": None,
+                    "next": self.get_next_link(),
+                    "previous": self.get_previous_link(),
+                    "results": data,
+                }
+            )
+        return super().get_paginated_response(data)
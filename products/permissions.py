@@ -4,7 +4,7 @@ from common.utils import is_user_manager
 
 class IsManagerAndProductOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return is_user_manager(request.user) and obj.added_by == request.user
+        return is_user_manager(request.user) and obj.added_by_id == request.user.id
 
 
 class IsManagerOrReadOnly(permissions.BasePermission):
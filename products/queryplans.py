@@ -0,0 +1,179 @@
+"""
+Query plan checks for the catalog endpoints.
+
+Each case requests a real endpoint, captures the SQL it runs and asks the
+database for its plan with ``EXPLAIN``. A plan that reads a large table with a
+sequential scan means an index the access pattern relies on is missing or no
+longer usable.
+"""
+
+import random
+import re
+from decimal import Decimal
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from users.models import CustomUser as User
+from .cache import bump_catalog_version, invalidate_product_cards
+from .models import Category, Product
+
+CHECKED_TABLES = ("products_product", "products_productreview")
+SEED_USERNAME = "catalog-seed"
+
+# Endpoint caches must not hide the queries, and the client's host must pass.
+_settings = {
+    "CACHES": {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "catalog-query-plans",
+        }
+    },
+    "ALLOWED_HOSTS": ["*"],
+}
+
+
+def seed_catalog(size, batch_size=5000):
+    """
+    Top the catalog up to ``size`` products spread over a small category tree.
+    Returns the number of products created.
+    """
+    owner, _ = User.objects.get_or_create(username=SEED_USERNAME)
+    if not Category.objects.exists():
+        for i in range(5):
+            root = Category.objects.create(name=f"Seed category {i}")
+            for j in range(5):
+                Category.objects.create(name=f"Seed category {i}.{j}", parent=root)
+    categories = list(Category.objects.values_list("pk", flat=True)) + [None]
+
+    missing = max(0, size - Product.objects.count())
+    start = Product.objects.filter(added_by=owner).count()
+    for offset in range(0, missing, batch_size):
+        created = Product.objects.bulk_create(
+            Product(
+                added_by=owner,
+                name=f"Seed product {n}",
+                slug=f"seed-product-{n}",
+                description="Seed product.",
+                price=Decimal(random.randint(100, 200_000)) / 100,
+                in_stock=random.choice((0, random.randint(1, 100))),
+                category_id=random.choice(categories),
+                rating_average=Decimal(random.randint(100, 500)) / 100,
+            )
+            for n in range(start + offset, start + min(offset + batch_size, missing))
+        )
+        # bulk_create sends no signals; drop any "no such product" markers.
+        invalidate_product_cards([product.pk for product in created])
+    if missing:
+        bump_catalog_version()
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return missing
+
+
+def endpoint_cases():
+    """
+    ``(label, path, params)`` for each access pattern worth an index.
+    """
+    products = reverse("product-list-create")
+    cases = [
+        ("latest", products, {}),
+        ("latest, cursor", products, {"pagination": "cursor"}),
+        ("cheapest", products, {"ordering": "price"}),
+        ("top rated", products, {"ordering": "-rating"}),
+        ("in stock", products, {"in_stock": "true"}),
+        ("price range", products, {"price_min": 100, "price_max": 110}),
+    ]
+
+    category = Category.objects.filter(parent=None).order_by("tree_id").first()
+    if category is not None:
+        cases += [
+            ("category", products, {"category": category.pk}),
+            (
+                "category by price",
+                products,
+                {"category": category.pk, "ordering": "price", "price_max": 50},
+            ),
+        ]
+
+    # Listings skip the COUNT(*); it reads the whole table by definition.
+    cases = [(label, path, dict(params, count="false")) for label, path, params in cases]
+
+    product = Product.objects.order_by("-pk").values_list("pk", flat=True).first()
+    if product is not None:
+        reviews = reverse("product-review-list-create", args=[product])
+        cases += [
+            ("detail", reverse("product-retrieve-update-destroy", args=[product]), {}),
+            ("reviews", reviews, {}),
+            ("reviews by rating", reviews, {"ordering": "-rating"}),
+            ("verified reviews", reviews, {"verified": "true"}),
+        ]
+    return cases
+
+
+def explain(sql):
+    """
+    The plan of ``sql`` as a list of lines.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute("EXPLAIN " + sql)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def sequential_scans(plan, tables=CHECKED_TABLES):
+    """
+    Tables of ``tables`` that ``plan`` reads with a sequential scan.
+    """
+    if connection.vendor == "sqlite":
+        pattern = re.compile(r"^SCAN (\w+)$")
+    else:
+        pattern = re.compile(r"Seq Scan on (\w+)")
+
+    scanned = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match and match.group(1) in tables:
+            scanned.append(match.group(1))
+    return scanned
+
+
+class PlanReport:
+    def __init__(self, label, path, params, status, queries):
+        self.label = label
+        self.path = path
+        self.params = params
+        self.status = status
+        # [(sql, plan lines, sequentially scanned tables)]
+        self.queries = queries
+
+    @property
+    def ok(self):
+        return self.status == 200 and not any(scans for _, _, scans in self.queries)
+
+
+def check_query_plans(cases=None, tables=CHECKED_TABLES):
+    """
+    Run every case and return one ``PlanReport`` each.
+    """
+    reports = []
+    with override_settings(**_settings):
+        client = Client()
+        for label, path, params in cases or endpoint_cases():
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(path, params, HTTP_ACCEPT="application/json")
+
+            queries = []
+            for query in captured.captured_queries:
+                sql = query["sql"]
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                if not any(f'"{table}"' in sql for table in tables):
+                    continue
+                plan = explain(sql)
+                queries.append((sql, plan, sequential_scans(plan, tables)))
+            reports.append(PlanReport(label, path, params, response.status_code, queries))
+    return reports
@@ -0,0 +1,167 @@
+"""
+Rating aggregates stored on ``Product``.
+
+Review writes fold their change into the product's counters with one atomic
+``UPDATE ... SET col = col + n`` so concurrent reviews never lose updates and
+reads never have to aggregate ``ProductReview`` rows.
+"""
+
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+from .cache import bump_catalog_version, invalidate_product_cards
+from .models import Product, ProductReview
+
+MIN_RATING = 1
+MAX_RATING = 5
+RATINGS = range(MIN_RATING, MAX_RATING + 1)
+
+
+def histogram_field(rating):
+    return f"rating_{rating}_count"
+
+
+SUMMARY_FIELDS = ("review_count", "rating_sum", "rating_average") + tuple(
+    histogram_field(rating) for rating in RATINGS
+)
+
+
+def rounded_average(rating_sum, review_count):
+    """
+    The stored average: ``rating_sum / review_count`` rounded half up to two
+    places, or 0 without reviews.
+    """
+    if not review_count:
+        return Decimal("0.00")
+    return Decimal((rating_sum * 200 + review_count) // (review_count * 2)).scaleb(-2)
+
+
+def rounded_average_expression(rating_sum, review_count):
+    """
+    ``rounded_average`` in SQL. The rounding is done in integers, so every
+    backend stores exactly the value that is read back and put in pagination
+    cursors; a float average (or a float rounded by the database) may not be.
+    """
+    hundredths = (rating_sum * 200 + review_count) / NullIf(review_count * 2, 0)
+    return Coalesce(
+        Cast(hundredths, FloatField()) / Value(100.0),
+        Value(0.0),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def rating_summary(product):
+    """
+    Average, count, sum and star histogram from the product's counters.
+    """
+    return {
+        "average": product.rating_average,
+        "count": product.review_count,
+        "sum": product.rating_sum,
+        "histogram": {
+            str(rating): getattr(product, histogram_field(rating)) for rating in RATINGS
+        },
+    }
+
+
+def _ratings_changed(product_ids):
+    # Review writes run in a transaction; drop the cards once they're visible.
+    def invalidate():
+        invalidate_product_cards(product_ids)
+        bump_catalog_version()
+
+    transaction.on_commit(invalidate)
+
+
+def apply_rating_change(product_id, added=None, removed=None):
+    """
+    Apply a review being added, removed or re-rated (both given) to the
+    product's aggregates in a single statement.
+    """
+    if added == removed:
+        return
+
+    count_delta = (added is not None) - (removed is not None)
+    sum_delta = (added or 0) - (removed or 0)
+    review_count = F("review_count") + count_delta
+    rating_sum = F("rating_sum") + sum_delta
+
+    updates = {
+        "review_count": review_count,
+        "rating_sum": rating_sum,
+        # Every right-hand side sees the pre-update row, so recompute the
+        # average from the same deltas.
+        "rating_average": rounded_average_expression(rating_sum, review_count),
+        "updated_at": timezone.now(),
+    }
+    if added is not None:
+        updates[histogram_field(added)] = F(histogram_field(added)) + 1
+    if removed is not None:
+        updates[histogram_field(removed)] = F(histogram_field(removed)) - 1
+
+    Product.objects.filter(pk=product_id).update(**updates)
+    _ratings_changed([product_id])
+
+
+def compute_rating_aggregates():
+    """
+    Recompute aggregates from ``ProductReview`` rows, keyed by product id.
+    Products without reviews are absent.
+    """
+    rows = (
+        ProductReview.objects.order_by()
+        .values("product")
+        .annotate(
+            review_count=Count("id"),
+            rating_sum=Sum("rating"),
+            **{
+                histogram_field(rating): Count("id", filter=Q(rating=rating))
+                for rating in RATINGS
+            },
+        )
+    )
+    return {row.pop("product"): row for row in rows.iterator()}
+
+
+def rebuild_rating_aggregates(dry_run=False, batch_size=1000):
+    """
+    Compare stored aggregates with a full recount and fix any drift.
+
+    Returns the ids of the products whose stored aggregates were wrong.
+    """
+    fields = ["review_count", "rating_sum"] + [histogram_field(r) for r in RATINGS]
+    empty = dict.fromkeys(fields, 0)
+    expected = compute_rating_aggregates()
+
+    drifted = []
+    # Read back as stored: the field itself would round an unrounded value
+    # (SQLite keeps whatever float was written) and hide it.
+    products = (
+        Product.objects.only("pk", *fields)
+        .annotate(stored_average=Cast("rating_average", FloatField()))
+        .order_by("pk")
+    )
+    for product in products.iterator(chunk_size=batch_size):
+        actual = expected.get(product.pk, empty)
+        average = rounded_average(actual["rating_sum"], actual["review_count"])
+        if product.stored_average == float(average) and all(
+            getattr(product, field) == actual[field] for field in fields
+        ):
+            continue
+
+        for field in fields:
+            setattr(product, field, actual[field])
+        product.rating_average = average
+        drifted.append(product)
+
+    if drifted and not dry_run:
+        now = timezone.now()
+        for product in drifted:
+            product.updated_at = now
+        Product.objects.bulk_update(
+            drifted, fields + ["rating_average", "updated_at"], batch_size=batch_size
+        )
+        _ratings_changed([product.pk for product in drifted])
+    return [product.pk for product in drifted]
@@ -0,0 +1,139 @@
+"""
+Full-text search backends for the product catalog.
+
+Postgres keeps a weighted ``tsvector`` per product in ``Product.search_vector``
+(GIN indexed). SQLite, used in development, mirrors ``name``/``description``
+into an FTS5 table. Both are kept up to date from the ``Product`` save path.
+"""
+
+import re
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = "english"
+FTS_TABLE = "products_product_fts"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(term):
+    return _TOKEN_RE.findall(term.lower())
+
+
+class PostgresSearchBackend:
+    def index(self, queryset):
+        from django.contrib.postgres.search import SearchVector
+
+        queryset.order_by().update(
+            search_vector=SearchVector("name", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("description", weight="B", config=SEARCH_CONFIG)
+        )
+
+    def remove(self, pks):
+        # The search document lives on the product row itself.
+        pass
+
+    def search(self, queryset, term):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        tokens = tokenize(term)
+        if not tokens:
+            return queryset
+
+        # Prefix match every token so results show up while the user types.
+        query = SearchQuery(
+            " & ".join(f"{token}:*" for token in tokens),
+            search_type="raw",
+            config=SEARCH_CONFIG,
+        )
+        return queryset.filter(search_vector=query).annotate(
+            # ts_rank() is a float4, which doesn't survive the round trip
+            # through a pagination cursor exactly; a float8 does.
+            search_rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+
+
+class SQLiteSearchBackend:
+    # bm25() column weights for (name, description).
+    weights = (10.0, 1.0)
+
+    def _table(self, queryset):
+        return queryset.model._meta.db_table
+
+    def index(self, queryset):
+        sql, params = queryset.order_by().values("pk").query.sql_with_params()
+        table = self._table(queryset)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({sql})", params
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+                f"SELECT id, name, description FROM {table} WHERE id IN ({sql})",
+                params,
+            )
+
+    def remove(self, pks):
+        pks = list(pks)
+        if not pks:
+            return
+        placeholders = ", ".join(["%s"] * len(pks))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", pks
+            )
+
+    def search(self, queryset, term):
+        tokens = tokenize(term)
+        if not tokens:
+            return queryset
+
+        match = " ".join(f'"{token}"*' for token in tokens)
+        table = self._table(queryset)
+        name_weight, description_weight = self.weights
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,)
+            )
+        ).annotate(
+            # bm25() is "lower is better"; negate it so both backends rank descending.
+            search_rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}, {name_weight}, {description_weight}) "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f'AND {FTS_TABLE}.rowid = "{table}"."id"',
+                (match,),
+                output_field=FloatField(),
+            )
+        )
+
+
+class BasicSearchBackend:
+    """
+    Fallback for databases without a full-text engine wired up.
+    """
+
+    def index(self, queryset):
+        pass
+
+    def remove(self, pks):
+        pass
+
+    def search(self, queryset, term):
+        condition = Q()
+        for token in tokenize(term):
+            condition &= Q(name__icontains=token) | Q(description__icontains=token)
+        return queryset.filter(condition).annotate(
+            search_rank=RawSQL("0", (), output_field=FloatField())
+        )
+
+
+_backends = {
+    "postgresql": PostgresSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+}
+
+
+def search_backend():
+    return _backends.get(connection.vendor, BasicSearchBackend)()
@@ -1,22 +1,47 @@
 from rest_framework import serializers
 from .models import Product, ProductImage, ProductReview, Category
 from users.serializers import UserSerializer
+from common.serializers import SparseFieldsMixin
+from .ratings import MIN_RATING, MAX_RATING, SUMMARY_FIELDS, rating_summary
+from .cards import ProductCardListSerializer
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ("id", "image", "is_primary")
-        read_only_fields = ("id", "image")
-
-
-class ProductSerializer(serializers.ModelSerializer):
+        fields = ("id", "image", "is_primary", "variants_status", "srcset")
+        read_only_fields = ("id", "image", "variants_status")
+
+    def get_srcset(self, obj):
+        """
+        One ``srcset`` string per format, e.g. ``{"webp": "a.webp 320w, ..."}``.
+        Empty until the variants have been rendered.
+        """
+        request = self.context.get("request")
+        entries = {}
+        for variant in obj.variants.all():
+            url = variant.file.url
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            entries.setdefault(variant.format, []).append(
+                (variant.width, f"{url} {variant.width}w")
+            )
+        return {
+            fmt: ", ".join(entry for _, entry in sorted(candidates))
+            for fmt, candidates in entries.items()
+        }
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     preview_images = serializers.ListField(
         child=serializers.ImageField(allow_empty_file=False, use_url=False),
         write_only=True,
         required=False,
     )
+    rating = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -31,9 +56,21 @@ class ProductSerializer(serializers.ModelSerializer):
             "category",
             "images",
             "preview_images",
+            "rating",
+            "primary_image",
         )
         read_only_fields = ("id", "added_by", "slug")
 
+    sparse_columns = {
+        "images": (),
+        "preview_images": (),
+        "rating": SUMMARY_FIELDS,
+    }
+    sparse_prefetch_related = {"images": ("images__variants",)}
+
+    def get_rating(self, obj):
+        return rating_summary(obj)
+
     def validate_price(self, price):
         if price <= 0:
             raise serializers.ValidationError("Price must be greater than 0.")
@@ -53,6 +90,9 @@ class ProductSerializer(serializers.ModelSerializer):
         images = validated_data.pop("preview_images", [])
         for image in images:
             ProductImage.objects.create(product=instance, image=image)
+        if images:
+            # Drop the gallery prefetched before the upload.
+            getattr(instance, "_prefetched_objects_cache", {}).pop("images", None)
 
         if "in_stock" in validated_data:
             instance.in_stock = validated_data["in_stock"]
@@ -61,12 +101,27 @@ class ProductSerializer(serializers.ModelSerializer):
 
         return instance
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        representation["images"] = ProductImageSerializer(
-            instance.images.all(), many=True
-        ).data
-        return representation
+
+class ProductListSerializer(ProductSerializer):
+    """
+    Lightweight product card for listings: only the primary image, no
+    description or gallery. Lists of cards are served from the card cache.
+    """
+
+    primary_image = ProductImageSerializer(read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        list_serializer_class = ProductCardListSerializer
+        fields = (
+            "id",
+            "name",
+            "slug",
+            "price",
+            "in_stock",
+            "category",
+            "rating",
+            "primary_image",
+        )
 
 
 class ProductReviewSerializer(serializers.ModelSerializer):
@@ -92,6 +147,13 @@ class ProductReviewSerializer(serializers.ModelSerializer):
             "updated_at",
         )
 
+    def validate_rating(self, rating):
+        if not MIN_RATING <= rating <= MAX_RATING:
+            raise serializers.ValidationError(
+                f"Rating must be between {MIN_RATING} and {MAX_RATING}."
+            )
+        return rating
+
 
 class CategorySerializer(serializers.ModelSerializer):
     subcategories = serializers.SerializerMethodField()
@@ -0,0 +1,211 @@
+"""
+Bulk loading and re-sync of the category tree.
+
+A taxonomy is a nested mapping of category names, with lists of names as
+leaves (the shape of ``categories.json``). It is merged into the existing
+tree in memory: nodes are matched by parent and name, so loading the same file
+again changes nothing and an updated file only adds what is new. The nested
+set numbering is then computed for the whole tree in one pass, the same way
+MPTT's ``rebuild`` would (roots and siblings ordered by name, as
+``order_insertion_by`` asks), new nodes are inserted with ``bulk_create`` one
+tree level at a time and only existing nodes whose numbering moved are
+shifted. Nodes are never saved one by one, so the category tree and catalog
+versions are bumped once at the end instead of per node.
+"""
+
+import time
+from django.db import transaction
+from django.db.models import F
+from .cache import bump_catalog_version, bump_category_tree_version
+from .utils import allocate_slugs
+
+TREE_FIELDS = ("tree_id", "lft", "rght", "level")
+
+
+class _Node:
+    def __init__(self, category, parent=None):
+        self.category = category
+        self.parent = parent
+        self.children = []
+        self.by_name = {}
+        self.wanted = False
+
+    def add(self, node):
+        self.children.append(node)
+        # Existing duplicates under one parent keep the first as the match.
+        self.by_name.setdefault(node.category.name, node)
+
+
+class SyncResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+def iter_taxonomy(taxonomy):
+    """
+    Yield ``(name, subtaxonomy)`` pairs for one level of a taxonomy.
+    """
+    if isinstance(taxonomy, dict):
+        yield from taxonomy.items()
+    elif isinstance(taxonomy, (list, tuple)):
+        for item in taxonomy:
+            if isinstance(item, dict):
+                yield from item.items()
+            else:
+                yield item, None
+    elif taxonomy is not None:
+        yield taxonomy, None
+
+
+def sync_category_tree(taxonomy, prune=False, batch_size=1000):
+    """
+    Merge ``taxonomy`` into the category tree and return a ``SyncResult``.
+
+    With ``prune``, existing categories missing from the taxonomy are deleted
+    (their products are left without a category).
+    """
+    from .models import Category
+
+    result = SyncResult()
+    with transaction.atomic():
+        existing = Category.objects.only("id", "parent_id", "name", *TREE_FIELDS)
+        root = _Node(None)
+        nodes = {category.pk: _Node(category) for category in existing}
+        for node in nodes.values():
+            parent = nodes.get(node.category.parent_id, root)
+            node.parent = parent
+            parent.add(node)
+
+        created = _merge(root, taxonomy, Category)
+        if prune:
+            result.deleted = _prune(root, Category)
+
+        shifts, levels = {}, {}
+        for node, numbering in _number(root):
+            category = node.category
+            if category.pk is None:
+                levels.setdefault(numbering[-1], []).append(node)
+            else:
+                shift = tuple(
+                    value - getattr(category, field)
+                    for field, value in zip(TREE_FIELDS, numbering)
+                )
+                if any(shift):
+                    shifts.setdefault(shift, []).append(category.pk)
+            for field, value in zip(TREE_FIELDS, numbering):
+                setattr(category, field, value)
+
+        allocate_slugs([node.category for node in created])
+        # Parents must have primary keys before their children go in.
+        for level in sorted(levels):
+            for node in levels[level]:
+                if node.parent.category is not None:
+                    node.category.parent_id = node.parent.category.pk
+            Category.objects.bulk_create(
+                [node.category for node in levels[level]], batch_size=batch_size
+            )
+        # Adding or removing a node moves whole ranges of the tree by the same
+        # amount, so the renumbering is a few shifts rather than a per-row
+        # ``bulk_update``.
+        for shift, pks in shifts.items():
+            values = {
+                field: F(field) + delta
+                for field, delta in zip(TREE_FIELDS, shift)
+                if delta
+            }
+            for start in range(0, len(pks), batch_size):
+                Category.objects.filter(pk__in=pks[start : start + batch_size]).update(
+                    **values
+                )
+
+        result.created = len(created)
+        result.updated = sum(len(pks) for pks in shifts.values())
+
+    if result.created or result.updated or result.deleted:
+        transaction.on_commit(bump_category_tree_version)
+        transaction.on_commit(bump_catalog_version)
+    return result
+
+
+def _merge(root, taxonomy, model):
+    created = []
+    stack = [(root, taxonomy)]
+    while stack:
+        parent, level = stack.pop()
+        for name, subtaxonomy in iter_taxonomy(level):
+            name = str(name).strip()
+            if not name:
+                continue
+            node = parent.by_name.get(name)
+            if node is None:
+                node = _Node(model(name=name), parent)
+                parent.add(node)
+                created.append(node)
+            node.wanted = True
+            stack.append((node, subtaxonomy))
+    return created
+
+
+def _prune(root, model):
+    doomed = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        kept = []
+        for child in node.children:
+            if child.wanted:
+                kept.append(child)
+                stack.append(child)
+            else:
+                # Deleting the top of an unwanted subtree cascades to the rest.
+                doomed.append(child.category.pk)
+        node.children = kept
+
+    if not doomed:
+        return 0
+    deleted, per_model = model.objects.filter(pk__in=doomed).delete()
+    return per_model.get(model._meta.label, 0)
+
+
+def _ordered(children):
+    return sorted(
+        children,
+        key=lambda node: (
+            node.category.name,
+            node.category.pk is None,
+            node.category.pk or 0,
+        ),
+    )
+
+
+def _number(root):
+    """
+    Yield ``(node, (tree_id, lft, rght, level))`` for every node in the tree.
+    """
+    for tree_id, tree_root in enumerate(_ordered(root.children), start=1):
+        counter = 1
+        # Each entry is (node, level, children still to visit or None when the
+        # node's left value hasn't been assigned yet).
+        lefts = {}
+        stack = [(tree_root, 0, None)]
+        while stack:
+            node, level, pending = stack.pop()
+            if pending is None:
+                lefts[node] = counter
+                counter += 1
+                pending = _ordered(node.children)
+                pending.reverse()
+            if pending:
+                child = pending.pop()
+                stack.append((node, level, pending))
+                stack.append((child, level + 1, None))
+                continue
+            yield node, (tree_id, lefts.pop(node), counter, level)
+            counter += 1
@@ -2,11 +2,34 @@ from rest_framework.test import APITestCase, APIClient
 from users.models import CustomUser as User
 from django.contrib.auth.models import Group
 from django.urls import reverse
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from io import BytesIO
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management import call_command
+from django.utils import timezone
+from django.core.management.base import CommandError
 from PIL import Image
 import os
-from .models import Product, Category
+import json
+import shutil
+import tempfile
+from .models import Product, ProductImage, ProductReview, Category
+from .cache import get_cache_stats
+from .filters import ProductFilter
+from .utils import allocate_slugs
+from .images import (
+    claim_pending_images,
+    read_original,
+    render_variants,
+    store_variants,
+)
+from .cards import get_cards
+from .views import ProductBatchView
+from .ratings import apply_rating_change
+from .queryplans import explain, sequential_scans
 
 
 class ProductListTests(APITestCase):
@@ -64,3 +87,1180 @@ class ProductListTests(APITestCase):
 #     # def test_product_detail(self):
 #     #     response = self.client.get("/api/products/1/")
 #     #     self.assertEqual(response.status_code, 200)
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("product-list-create")
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.category = Category.objects.create(name="TestCategory")
+
+        for name, description in [
+            ("USB-C Cable", "Braided charging cable"),
+            ("Wireless Charger", "Fast charging pad, cable included"),
+            ("Laptop Stand", "Aluminium stand"),
+        ]:
+            Product.objects.create(
+                added_by=self.user,
+                name=name,
+                description=description,
+                price=10,
+                in_stock=5,
+                category=self.category,
+            )
+
+    def search(self, term, **params):
+        response = self.client.get(self.url, {"search": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.data["results"]]
+
+    def test_search_ranks_name_matches_first(self):
+        self.assertEqual(self.search("cable"), ["USB-C Cable", "Wireless Charger"])
+
+    def test_search_matches_prefixes(self):
+        self.assertEqual(self.search("lap"), ["Laptop Stand"])
+
+    def test_ranked_results_page_by_cursor(self):
+        for url in (self.url, reverse("async-product-list")):
+            names, params = [], {"search": "cable", "pagination": "cursor", "page_size": 1}
+            while url:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                names += [product["name"] for product in response.data["results"]]
+                url, params = response.data["next"], None
+            self.assertEqual(names, ["USB-C Cable", "Wireless Charger"])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        product = Product.objects.get(name="Laptop Stand")
+        product.name = "Monitor Stand"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.search("laptop"), [])
+        self.assertEqual(self.search("monitor"), ["Monitor Stand"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.search("stand"), [])
+
+
+class ProductPaginationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("product-list-create")
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        Product.objects.bulk_create(
+            Product(
+                added_by=self.user,
+                name=f"Product {i}",
+                slug=f"product-{i}",
+                description="Description",
+                price=10 + i % 3,
+                in_stock=5,
+            )
+            for i in range(10)
+        )
+
+    def walk(self, params):
+        names, url = [], self.url
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            names += [product["name"] for product in response.data["results"]]
+            url, params = response.data["next"], None
+        return names
+
+    def test_cursor_pages_follow_price_ordering(self):
+        expected = list(
+            Product.objects.order_by("price", "id").values_list("name", flat=True)
+        )
+        names = self.walk({"pagination": "cursor", "ordering": "price", "page_size": 3})
+        self.assertEqual(names, expected)
+
+    def test_cursor_previous_link_returns_previous_page(self):
+        params = {"pagination": "cursor", "page_size": 4}
+        first = self.client.get(self.url, params).data
+        second = self.client.get(first["next"]).data
+        previous = self.client.get(second["previous"]).data
+        self.assertEqual(previous["results"], first["results"])
+
+    def test_count_can_be_skipped(self):
+        response = self.client.get(self.url, {"count": "false", "page_size": 4, "page": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data["count"])
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("product-list-create")
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.product = Product.objects.create(
+            added_by=self.user,
+            name="Product 1",
+            description="Description 1",
+            price=10,
+            in_stock=5,
+        )
+
+    def test_equivalent_queries_share_an_entry(self):
+        first = self.client.get(self.url + "?page_size=5&ordering=price")
+        second = self.client.get(self.url + "?ordering=price&page_size=5&search=")
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.data, second.data)
+
+        stats = get_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_product_write_invalidates_cached_responses(self):
+        self.client.get(self.url)
+        self.product.name = "Renamed product"
+        # Invalidation waits for the write to commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["name"], "Renamed product")
+
+
+class ProductRatingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.other = User.objects.create_user(username="other", password="userpass")
+        self.product = Product.objects.create(
+            added_by=self.user,
+            name="Product 1",
+            description="Description 1",
+            price=10,
+            in_stock=5,
+        )
+
+    def review(self, user, rating):
+        self.client.force_authenticate(user)
+        url = reverse("product-review-list-create", args=[self.product.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {"rating": rating})
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def rating(self):
+        url = reverse("product-retrieve-update-destroy", args=[self.product.pk])
+        return self.client.get(url).data["rating"]
+
+    def test_aggregates_follow_review_writes(self):
+        self.review(self.user, 5)
+        review_id = self.review(self.other, 2)
+
+        rating = self.rating()
+        self.assertEqual((rating["count"], rating["sum"]), (2, 7))
+        self.assertEqual(rating["average"], Decimal("3.50"))
+        self.assertEqual(rating["histogram"]["2"], 1)
+
+        url = reverse("product-review-update-destroy", args=[review_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {"rating": 4})
+        rating = self.rating()
+        self.assertEqual(rating["average"], Decimal("4.50"))
+        self.assertEqual((rating["histogram"]["2"], rating["histogram"]["4"]), (0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url)
+        rating = self.rating()
+        self.assertEqual((rating["count"], rating["sum"]), (1, 5))
+        self.assertEqual(rating["average"], Decimal("5.00"))
+
+    def test_rating_out_of_range_is_rejected(self):
+        self.client.force_authenticate(self.user)
+        url = reverse("product-review-list-create", args=[self.product.pk])
+        response = self.client.post(url, {"rating": 6})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_fixes_drift(self):
+        self.review(self.user, 3)
+        Product.objects.filter(pk=self.product.pk).update(review_count=9)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_ratings", "--check", stdout=StringIO())
+        call_command("rebuild_ratings", stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 1)
+
+        # Right counters, wrong average.
+        self.review(self.other, 4)
+        Product.objects.filter(pk=self.product.pk).update(rating_average=Decimal("4.00"))
+        with self.assertRaises(CommandError):
+            call_command("rebuild_ratings", "--check", stdout=StringIO())
+        call_command("rebuild_ratings", stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_average, Decimal("3.50"))
+
+    def test_cursor_pages_through_tied_averages(self):
+        # 10/3 and 7/3 don't terminate; ties make the cursor seek on them.
+        for i, ratings in enumerate([(3, 3, 4), (2, 2, 3), (3, 3, 4), (5,), (2, 2, 3)]):
+            product = Product.objects.create(
+                added_by=self.user, name=f"Rated {i}", description="-", price=10, in_stock=5
+            )
+            for rating in ratings:
+                apply_rating_change(product.pk, added=rating)
+        self.assertEqual(
+            Product.objects.get(name="Rated 0").rating_average, Decimal("3.33")
+        )
+
+        url = reverse("product-list-create")
+        for ordering in ("rating", "-rating"):
+            prefix = ordering[: -len("rating")]
+            expected = list(
+                Product.objects.order_by(
+                    f"{prefix}rating_average", f"{prefix}id"
+                ).values_list("name", flat=True)
+            )
+            names = []
+            params = {"pagination": "cursor", "ordering": ordering, "page_size": 2}
+            response = self.client.get(url, params)
+            for _ in range(len(expected)):
+                names += [product["name"] for product in response.data["results"]]
+                if not response.data["next"]:
+                    break
+                response = self.client.get(response.data["next"])
+            self.assertEqual(names, expected)
+
+            # And back again from the last page.
+            back = [product["name"] for product in response.data["results"]]
+            for _ in range(len(expected)):
+                if not response.data["previous"]:
+                    break
+                response = self.client.get(response.data["previous"])
+                back = [product["name"] for product in response.data["results"]] + back
+            self.assertEqual(back, expected)
+
+    def test_list_orders_by_rating(self):
+        low = Product.objects.create(
+            added_by=self.user, name="Product 2", description="-", price=10, in_stock=5
+        )
+        self.review(self.user, 5)
+        self.product = low
+        self.review(self.user, 1)
+
+        url = reverse("product-list-create")
+        for params in ({"ordering": "-rating"}, {"ordering": "-rating", "pagination": "cursor"}):
+            response = self.client.get(url, params)
+            names = [product["name"] for product in response.data["results"]]
+            self.assertEqual(names, ["Product 1", "Product 2"])
+
+
+class CategoryFilterTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.electronics = Category.objects.create(name="Electronics")
+        self.phones = Category.objects.create(name="Phones", parent=self.electronics)
+        self.books = Category.objects.create(name="Books")
+
+        for name, category in [
+            ("TV", self.electronics),
+            ("Phone", self.phones),
+            ("Novel", self.books),
+        ]:
+            Product.objects.create(
+                added_by=self.user,
+                name=name,
+                description="-",
+                price=10,
+                in_stock=5,
+                category=category,
+            )
+
+    def filter(self, value):
+        products = ProductFilter({"category": value}, queryset=Product.objects.all()).qs
+        return sorted(product.name for product in products)
+
+    def test_filter_includes_descendants_in_one_query(self):
+        self.filter(self.books.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.filter(self.electronics.pk), ["Phone", "TV"])
+
+    def test_unknown_category_matches_nothing(self):
+        self.assertEqual(self.filter(0), [])
+        self.assertEqual(self.filter("phones"), [])
+
+    def test_category_writes_refresh_the_tree(self):
+        self.assertEqual(self.filter(self.books.pk), ["Novel"])
+        phones = Category.objects.get(pk=self.phones.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            phones.move_to(Category.objects.get(pk=self.books.pk))
+        self.assertEqual(self.filter(self.books.pk), ["Novel", "Phone"])
+
+
+class CategoryTreeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        electronics = Category.objects.create(name="Electronics")
+        phones = Category.objects.create(name="Phones", parent=electronics)
+        Category.objects.create(name="Smartphones", parent=phones)
+        self.books = Category.objects.create(name="Books")
+
+    def tree(self):
+        response = self.client.get(reverse("category-tree"))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_tree_is_full_depth(self):
+        tree = self.tree()
+        self.assertEqual([node["name"] for node in tree], ["Books", "Electronics"])
+        smartphones = tree[1]["subcategories"][0]["subcategories"][0]
+        self.assertEqual(smartphones["name"], "Smartphones")
+
+    def test_tree_is_served_from_snapshot_until_a_write(self):
+        self.tree()
+        with self.assertNumQueries(0):
+            self.tree()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Poetry", parent=self.books)
+        self.assertEqual(self.tree()[0]["subcategories"][0]["name"], "Poetry")
+
+    def test_retrieve_lists_direct_children(self):
+        response = self.client.get(reverse("category-retrieve", args=[self.books.pk]))
+        self.assertEqual(response.data["subcategories"], [])
+        response = self.client.get(reverse("category-retrieve", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SlugAllocationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+
+    def product(self, name):
+        return Product(
+            added_by=self.user, name=name, description="-", price=10, in_stock=5
+        )
+
+    def test_next_free_suffix_is_picked(self):
+        for _ in range(3):
+            self.product("USB-C Cable").save()
+        self.product("USB-C Cable Holder").save()
+
+        slugs = set(Product.objects.values_list("slug", flat=True))
+        self.assertEqual(
+            slugs, {"usb-c-cable", "usb-c-cable-2", "usb-c-cable-3", "usb-c-cable-holder"}
+        )
+
+    def test_batch_allocation_costs_one_query_per_name(self):
+        self.product("USB-C Cable").save()
+        batch = [self.product("USB-C Cable") for _ in range(50)]
+        batch.append(self.product("HDMI Cable"))
+
+        with self.assertNumQueries(2):
+            slugs = allocate_slugs(batch)
+
+        self.assertEqual(len(set(slugs)), 51)
+        self.assertEqual(slugs[0], "usb-c-cable-2")
+        self.assertEqual(slugs[-1], "hdmi-cable")
+
+    def test_long_names_are_truncated_before_the_suffix(self):
+        name = "x" * 100
+        first, second = self.product(name), self.product(name)
+        first.save()
+        second.save()
+        self.assertEqual(len(second.slug), 50)
+        self.assertTrue(second.slug.endswith("-2"))
+
+    def test_insert_retries_after_losing_a_slug_race(self):
+        self.product("USB-C Cable").save()
+        stale = iter(["usb-c-cable"])
+
+        def slugify_once_stale(instance):
+            instance.slug = next(stale, None) or allocate_slugs([instance])[0]
+
+        with patch("products.models.unique_slugify", side_effect=slugify_once_stale):
+            product = self.product("USB-C Cable")
+            product.save()
+
+        self.assertEqual(product.slug, "usb-c-cable-2")
+
+
+class ProductImportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="manager", password="userpass")
+        electronics = Category.objects.create(name="Electronics")
+        self.laptops = Category.objects.create(name="Laptops", parent=electronics)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_import_csv_with_rejects_and_upserts(self):
+        Product.objects.create(
+            added_by=self.user,
+            name="Old name",
+            description="-",
+            price=5,
+            in_stock=1,
+        )
+        existing_slug = Product.objects.get().slug
+        path = self.write(
+            "products.csv",
+            "slug,name,description,price,in_stock,category\n"
+            f"{existing_slug},New name,Updated,12.50,3,Electronics > laptops\n"
+            ",USB-C Cable,Braided,9.99,10,\n"
+            ",USB-C Cable,Braided,9.99,10,\n"
+            ",X,Too short,0,1,Nowhere\n",
+        )
+        rejects = os.path.join(self.tmpdir, "rejects.jsonl")
+
+        call_command(
+            "import_products",
+            path,
+            "--owner=manager",
+            "--batch-size=2",
+            f"--rejects={rejects}",
+            stdout=StringIO(),
+        )
+
+        updated = Product.objects.get(slug=existing_slug)
+        self.assertEqual((updated.name, updated.category_id), ("New name", self.laptops.pk))
+        self.assertEqual(
+            sorted(Product.objects.filter(name="USB-C Cable").values_list("slug", flat=True)),
+            ["usb-c-cable", "usb-c-cable-2"],
+        )
+
+        with open(rejects) as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(rejected[0]["line"], 5)
+        self.assertEqual(set(rejected[0]["errors"]), {"name", "price", "category"})
+
+    def test_imported_products_are_searchable(self):
+        path = self.write(
+            "products.jsonl",
+            json.dumps({"name": "Gaming Laptop", "description": "-", "price": 999, "in_stock": 2})
+            + "\n",
+        )
+        call_command("import_products", path, "--owner=manager", stdout=StringIO())
+
+        response = self.client.get(reverse("product-list-create"), {"search": "gaming"})
+        self.assertEqual(response.data["results"][0]["name"], "Gaming Laptop")
+
+
+class ProductExportTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("product-export")
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        electronics = Category.objects.create(name="Electronics")
+        laptops = Category.objects.create(name="Laptops", parent=electronics)
+        self.product = Product.objects.create(
+            added_by=self.user,
+            name="Gaming Laptop",
+            description="-",
+            price=999,
+            in_stock=2,
+            category=laptops,
+        )
+        ProductImage.objects.create(product=self.product, image="products/laptop.jpg")
+        self.client.force_authenticate(self.user)
+
+    def stream(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        records = [json.loads(line) for line in self.stream().splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["category_path"], "Electronics > Laptops")
+        self.assertTrue(records[0]["primary_image_url"].endswith("products/laptop.jpg"))
+
+    def test_csv_export(self):
+        lines = self.stream(format="csv").splitlines()
+        self.assertTrue(lines[0].startswith("id,slug,name"))
+        self.assertEqual(len(lines), 2)
+
+    def test_updated_since_filters_unchanged_products(self):
+        self.assertEqual(self.stream(updated_since="2999-01-01"), "")
+        response = self.client.get(self.url, {"updated_since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImageVariantTests(APITestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = self.settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.product = Product.objects.create(
+            added_by=self.user, name="Product 1", description="-", price=10, in_stock=5
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media)
+
+    def upload(self, size):
+        buffer = BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "jpeg")
+        return ProductImage.objects.create(
+            product=self.product,
+            image=SimpleUploadedFile("photo.jpg", buffer.getvalue()),
+        )
+
+    def test_render_variants_never_upscales(self):
+        buffer = BytesIO()
+        Image.new("RGB", (400, 200)).save(buffer, "png")
+        variants = render_variants(buffer.getvalue(), formats=("webp",))
+        self.assertEqual(
+            [(v["width"], v["height"]) for v in variants], [(160, 80), (320, 160)]
+        )
+
+    def test_worker_processes_pending_images(self):
+        image = self.upload((700, 350))
+        self.assertEqual(image.variants_status, "pending")
+
+        call_command("process_image_variants", "--once", "--workers=1", stdout=StringIO())
+
+        image.refresh_from_db()
+        self.assertEqual(image.variants_status, "ready")
+        widths = set(image.variants.values_list("width", flat=True))
+        self.assertEqual(widths, {160, 320, 640})
+
+        url = reverse("product-retrieve-update-destroy", args=[self.product.pk])
+        srcset = self.client.get(url).data["images"][0]["srcset"]
+        self.assertIn("640w", srcset["webp"])
+
+    def test_failed_renders_drop_the_card(self):
+        cache.clear()
+        ProductImage.objects.create(
+            product=self.product,
+            image=SimpleUploadedFile("photo.jpg", b"not an image"),
+        )
+        card = get_cards([self.product.pk])[self.product.pk]
+        self.assertEqual(card["primary_image"]["variants_status"], "pending")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "process_image_variants", "--once", "--workers=1", stdout=StringIO()
+            )
+        card = get_cards([self.product.pk])[self.product.pk]
+        self.assertEqual(card["primary_image"]["variants_status"], "failed")
+
+    def test_variants_of_deleted_images_are_not_kept(self):
+        image = self.upload((200, 100))
+        variants = render_variants(read_original(image), formats=("webp",))
+        ProductImage.objects.filter(pk=image.pk).delete()
+
+        with self.assertRaises(ProductImage.DoesNotExist):
+            store_variants(image, variants)
+        self.assertEqual(os.listdir(os.path.join(self.media, "products/variants")), [])
+
+    def test_abandoned_claims_are_taken_over(self):
+        image = self.upload((200, 100))
+        call_command("process_image_variants", "--once", "--workers=1", stdout=StringIO())
+        old_files = list(image.variants.values_list("file", flat=True))
+
+        # A worker claimed it again, then died.
+        ProductImage.objects.filter(pk=image.pk).update(variants_status="processing")
+        self.assertEqual(claim_pending_images(10), [])
+        ProductImage.objects.filter(pk=image.pk).update(
+            variants_claimed_at=timezone.now() - timedelta(hours=1)
+        )
+        call_command("backfill_image_variants", "--workers=1", stdout=StringIO())
+
+        image.refresh_from_db()
+        self.assertEqual(image.variants_status, "ready")
+        new_files = list(image.variants.values_list("file", flat=True))
+        self.assertEqual(len(new_files), len(old_files))
+        for name in old_files:
+            self.assertFalse(os.path.exists(os.path.join(self.media, name)))
+        for name in new_files:
+            self.assertTrue(os.path.exists(os.path.join(self.media, name)))
+
+
+class PrimaryImageTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.product = Product.objects.create(
+            added_by=self.user, name="Product 1", description="-", price=10, in_stock=5
+        )
+
+    def add_image(self, name, is_primary=False):
+        return ProductImage.objects.create(
+            product=self.product, image=f"products/{name}.jpg", is_primary=is_primary
+        )
+
+    def primary_image_id(self):
+        self.product.refresh_from_db()
+        return self.product.primary_image_id
+
+    def test_pointer_follows_image_writes(self):
+        first = self.add_image("first")
+        self.assertEqual(self.primary_image_id(), first.pk)
+
+        second = self.add_image("second", is_primary=True)
+        self.assertEqual(self.primary_image_id(), second.pk)
+
+        second.delete()
+        self.assertEqual(self.primary_image_id(), first.pk)
+
+        first.delete()
+        self.assertIsNone(self.primary_image_id())
+
+    def test_list_renders_primary_image_only(self):
+        for i in range(5):
+            self.add_image(f"gallery-{i}")
+        Product.objects.create(
+            added_by=self.user, name="Product 2", description="-", price=10, in_stock=5
+        )
+
+        # count, page, then the missing cards: products joined with their
+        # primary image, its variants
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("product-list-create"))
+
+        cards = {card["name"]: card for card in response.data["results"]}
+        self.assertNotIn("images", cards["Product 1"])
+        self.assertNotIn("description", cards["Product 1"])
+        self.assertTrue(cards["Product 1"]["primary_image"]["image"].endswith("gallery-0.jpg"))
+        self.assertIsNone(cards["Product 2"]["primary_image"])
+
+
+class ProductCardTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.products = [
+            Product.objects.create(
+                added_by=self.user, name=f"Product {i}", description="-", price=10, in_stock=5
+            )
+            for i in range(3)
+        ]
+
+    def test_cards_are_cached_per_product(self):
+        # No primary images, so nothing to prefetch.
+        with self.assertNumQueries(1):
+            cards = get_cards([product.pk for product in self.products])
+        self.assertEqual(len(cards), 3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cards([product.pk for product in self.products]), cards)
+
+        # A different page only renders the cards it hasn't seen.
+        url = reverse("product-list-create")
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"ordering": "price"})
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_writes_drop_the_card(self):
+        product = self.products[0]
+        get_cards([product.pk])
+
+        product.in_stock = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(get_cards([product.pk])[product.pk]["in_stock"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=product, image="products/card.jpg")
+        card = get_cards([product.pk])[product.pk]
+        self.assertTrue(card["primary_image"]["image"].endswith("card.jpg"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_rating_change(product.pk, added=4)
+        self.assertEqual(get_cards([product.pk])[product.pk]["rating"]["count"], 1)
+
+        pk = product.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(get_cards([pk]), {})
+
+    def test_missing_products_are_remembered_briefly(self):
+        pk = self.products[-1].pk + 100
+        with self.settings(PRODUCT_CARD_MISSING_TIMEOUT=0):
+            self.assertEqual(get_cards([pk]), {})
+
+        # Created without signals, so nothing drops the marker.
+        Product.objects.bulk_create(
+            [
+                Product(
+                    pk=pk,
+                    added_by=self.user,
+                    name="Late",
+                    slug="late",
+                    description="-",
+                    price=10,
+                    in_stock=5,
+                )
+            ]
+        )
+        self.assertEqual(get_cards([pk])[pk]["name"], "Late")
+
+    def test_image_urls_are_made_absolute_per_request(self):
+        ProductImage.objects.create(product=self.products[0], image="products/card.jpg")
+
+        response = self.client.get(reverse("product-list-create"))
+
+        card = next(c for c in response.data["results"] if c["id"] == self.products[0].pk)
+        url = card["primary_image"]["image"]
+        self.assertTrue(url.startswith("http://testserver/"))
+        cached = get_cards([self.products[0].pk])[self.products[0].pk]
+        self.assertEqual(url, "http://testserver" + cached["primary_image"]["image"])
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.product = Product.objects.create(
+            added_by=self.user, name="Product 1", description="x" * 2000, price=10, in_stock=5
+        )
+        ProductImage.objects.create(product=self.product, image="products/a.jpg")
+        self.url = reverse("product-retrieve-update-destroy", args=[self.product.pk])
+
+    def test_detail_fields(self):
+        # The ETag lookup, then one narrow row and no gallery prefetch.
+        with self.assertNumQueries(2) as queries:
+            response = self.client.get(self.url, {"fields": "id,name,price"})
+
+        self.assertEqual(set(response.data), {"id", "name", "price"})
+        self.assertNotIn("description", queries.captured_queries[1]["sql"])
+
+    def test_detail_omit(self):
+        response = self.client.get(self.url, {"omit": "description,images"})
+
+        self.assertNotIn("description", response.data)
+        self.assertNotIn("images", response.data)
+        self.assertIn("rating", response.data)
+
+    def test_unknown_field(self):
+        response = self.client.get(self.url, {"fields": "id,secret"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_cards_are_cut_down(self):
+        response = self.client.get(
+            reverse("product-list-create"), {"fields": "id,name,primary_image"}
+        )
+
+        card = response.data["results"][0]
+        self.assertEqual(set(card), {"id", "name", "primary_image"})
+        self.assertTrue(card["primary_image"]["image"].startswith("http://testserver/"))
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.product = Product.objects.create(
+            added_by=self.user, name="Product 1", description="-", price=10, in_stock=5
+        )
+
+    def assertRevalidates(self, url, change, queries=0):
+        response = self.client.get(url)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_product_detail(self):
+        url = reverse("product-retrieve-update-destroy", args=[self.product.pk])
+        self.assertRevalidates(
+            url, lambda: apply_rating_change(self.product.pk, added=5), queries=1
+        )
+
+    def test_product_detail_last_modified(self):
+        url = reverse("product-retrieve-update-destroy", args=[self.product.pk])
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_list(self):
+        self.assertRevalidates(
+            reverse("product-list-create"),
+            lambda: Product.objects.create(
+                added_by=self.user, name="Product 2", description="-", price=10, in_stock=5
+            ),
+        )
+
+    def test_list_etag_depends_on_query(self):
+        url = reverse("product-list-create")
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, {"ordering": "price"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_category_tree(self):
+        self.assertRevalidates(
+            reverse("category-tree"), lambda: Category.objects.create(name="Books")
+        )
+
+
+class FacetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.electronics = Category.objects.create(name="Electronics")
+        self.laptops = Category.objects.create(name="Laptops", parent=self.electronics)
+        self.books = Category.objects.create(name="Books")
+        for category, price in [
+            (self.laptops, 900),
+            (self.laptops, 1500),
+            (self.electronics, 20),
+            (self.books, 5),
+            (None, 30),
+        ]:
+            Product.objects.create(
+                added_by=self.user,
+                name="Product",
+                description="-",
+                price=price,
+                in_stock=1,
+                category=category,
+            )
+        self.url = reverse("product-list-create")
+
+    def test_facets(self):
+        # count, page, cards (no images to prefetch), facets, tree snapshot
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url, {"facets": "all"})
+
+        categories = {c["name"]: c["count"] for c in response.data["facets"]["category"]}
+        self.assertEqual(categories, {"Electronics": 3, "Laptops": 2, "Books": 1})
+        price = {(b["min"], b["max"]): b["count"] for b in response.data["facets"]["price"]}
+        self.assertEqual(price[(None, 10)], 1)
+        self.assertEqual(price[(10, 25)], 1)
+        self.assertEqual(price[(25, 50)], 1)
+        self.assertEqual(price[(500, 1000)], 1)
+        self.assertEqual(price[(1000, None)], 1)
+
+    def test_facets_follow_filters(self):
+        response = self.client.get(
+            self.url, {"facets": "category", "category": self.electronics.pk}
+        )
+
+        self.assertNotIn("price", response.data["facets"])
+        categories = {c["name"]: c["count"] for c in response.data["facets"]["category"]}
+        self.assertEqual(categories, {"Electronics": 3, "Laptops": 2})
+
+    def test_facets_are_cached_by_filter_signature(self):
+        self.client.get(self.url, {"facets": "price", "page_size": 2})
+
+        # A different page of the same result set: count, page, cards only.
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {"facets": "price", "page_size": 2, "page": 2})
+
+    def test_facets_with_search(self):
+        response = self.client.get(self.url, {"facets": "category", "search": "product"})
+
+        categories = {c["name"]: c["count"] for c in response.data["facets"]["category"]}
+        self.assertEqual(categories, {"Electronics": 3, "Laptops": 2, "Books": 1})
+
+    def test_unknown_facet(self):
+        response = self.client.get(self.url, {"facets": "color"})
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryPlanTests(APITestCase):
+    def test_catalog_endpoints_use_indexes(self):
+        out = StringIO()
+        call_command("check_query_plans", seed=2000, stdout=out)
+
+        self.assertEqual(Product.objects.count(), 2000)
+        self.assertIn("All 12 query plans use indexes.", out.getvalue())
+
+    def test_sequential_scan_is_reported(self):
+        plan = explain('SELECT * FROM "products_product" WHERE "name" = \'x\'')
+        self.assertEqual(sequential_scans(plan), ["products_product"])
+
+
+class ProductReviewListTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.product = Product.objects.create(
+            added_by=self.user, name="Product 1", description="-", price=10, in_stock=5
+        )
+        users = [
+            User.objects.create_user(username=f"reviewer{i}", password="userpass")
+            for i in range(5)
+        ]
+        for i, (user, rating) in enumerate(zip(users, [5, 3, 4, 1, 5])):
+            ProductReview.objects.create(
+                product=self.product, user=user, rating=rating, is_verified=i % 2 == 0
+            )
+            apply_rating_change(self.product.pk, added=rating)
+        self.url = reverse("product-review-list-create", args=[self.product.pk])
+
+    def test_pages_follow_cursor(self):
+        # page of reviews with their users, product counters
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {"page_size": 2})
+
+        self.assertNotIn("count", response.data)
+        ids = [review["id"] for review in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            ids += [review["id"] for review in response.data["results"]]
+
+        expected = ProductReview.objects.order_by("-created_at", "-id")
+        self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+
+    def test_order_by_rating(self):
+        response = self.client.get(self.url, {"ordering": "-rating", "page_size": 3})
+
+        ratings = [review["rating"] for review in response.data["results"]]
+        self.assertEqual(ratings, [5, 5, 4])
+
+    def test_verified_filter(self):
+        response = self.client.get(self.url, {"verified": "true"})
+
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertTrue(all(review["is_verified"] for review in response.data["results"]))
+
+    def test_summary_comes_from_counters(self):
+        response = self.client.get(self.url, {"verified": "true"})
+
+        summary = response.data["summary"]
+        self.assertEqual(summary["count"], 5)
+        self.assertEqual(summary["histogram"], {"1": 1, "2": 0, "3": 1, "4": 1, "5": 2})
+
+    def test_unknown_product(self):
+        response = self.client.get(reverse("product-review-list-create", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncCatalogTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.category = Category.objects.create(name="Books")
+        self.products = [
+            Product.objects.create(
+                added_by=self.user,
+                name=f"Product {i}",
+                description="-",
+                price=10 + i,
+                in_stock=5,
+                category=self.category,
+            )
+            for i in range(3)
+        ]
+
+    def test_product_list_matches_sync(self):
+        params = {"pagination": "cursor", "ordering": "-price", "page_size": 2}
+        expected = self.client.get(reverse("product-list-create"), params).json()
+
+        response = self.client.get(reverse("async-product-list"), params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], expected["results"])
+        self.assertIsNotNone(response.json()["next"])
+
+        etag = response["ETag"]
+        response = self.client.get(
+            reverse("async-product-list"), params, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_detail(self):
+        product = self.products[0]
+        response = self.client.get(reverse("async-product-detail", args=[product.pk]))
+
+        self.assertEqual(response.json()["name"], product.name)
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("async-product-detail", args=[product.pk]),
+                HTTP_IF_NONE_MATCH=response["ETag"],
+            )
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse("async-product-detail", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_review_list(self):
+        product = self.products[0]
+        ProductReview.objects.create(product=product, user=self.user, rating=4)
+        apply_rating_change(product.pk, added=4)
+
+        response = self.client.get(reverse("async-product-review-list", args=[product.pk]))
+
+        data = response.json()
+        self.assertEqual([review["rating"] for review in data["results"]], [4])
+        self.assertEqual(data["summary"]["histogram"]["4"], 1)
+
+    def test_categories(self):
+        response = self.client.get(reverse("async-categories-list"))
+        self.assertEqual(response.json(), self.client.get(reverse("categories-list")).json())
+
+        response = self.client.get(reverse("async-category-retrieve", args=[self.category.pk]))
+        self.assertEqual(response.json()["name"], "Books")
+
+    def test_writes_are_not_allowed(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse("async-product-list"), {})
+        self.assertEqual(response.status_code, 405)
+
+
+class ProductBatchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="userpass")
+        self.products = [
+            Product.objects.create(
+                added_by=self.user, name=f"Product {i}", description="-", price=10, in_stock=5
+            )
+            for i in range(4)
+        ]
+        ProductImage.objects.create(product=self.products[1], image="products/b.jpg")
+        self.url = reverse("product-batch")
+
+    def test_ids_keep_request_order(self):
+        ids = [self.products[2].pk, 0, self.products[1].pk, self.products[2].pk]
+
+        # products joined with their primary images, their variants
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {"ids": ",".join(map(str, ids))})
+
+        self.assertEqual(
+            [card["id"] for card in response.data["results"]],
+            [self.products[2].pk, self.products[1].pk],
+        )
+        self.assertEqual(response.data["missing"], [0])
+
+        # Cards are cached now.
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {"ids": ",".join(map(str, ids))})
+
+    def test_slugs(self):
+        slugs = [self.products[3].slug, "nope", self.products[0].slug]
+
+        response = self.client.get(self.url, {"slugs": ",".join(slugs), "fields": "id,slug"})
+
+        self.assertEqual(
+            response.data["results"],
+            [
+                {"id": self.products[3].pk, "slug": self.products[3].slug},
+                {"id": self.products[0].pk, "slug": self.products[0].slug},
+            ],
+        )
+        self.assertEqual(response.data["missing"], ["nope"])
+
+    def test_bounds_and_validation(self):
+        too_many = ",".join(str(i) for i in range(1, ProductBatchView.max_batch_size + 2))
+        self.assertEqual(self.client.get(self.url, {"ids": too_many}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"ids": "1,x"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(
+            self.client.get(self.url, {"ids": "1", "slugs": "a"}).status_code, 400
+        )
+
+
+class CategorySyncTests(APITestCase):
+    taxonomy = {
+        "Electronics": {"Phones": ["Smartphones", "Feature Phones"], "Laptops": []},
+        "Books": ["Poetry", "Fiction"],
+    }
+
+    def numbering(self):
+        return {
+            row["id"]: row
+            for row in Category.objects.values("id", "tree_id", "lft", "rght", "level")
+        }
+
+    def assertMatchesRebuild(self):
+        numbering = self.numbering()
+        Category.objects.rebuild()
+        self.assertEqual(numbering, self.numbering())
+
+    def test_load(self):
+        result = Category.objects.sync_tree(self.taxonomy)
+
+        self.assertEqual(result.created, 8)
+        self.assertMatchesRebuild()
+        smartphones = Category.objects.get(name="Smartphones")
+        self.assertEqual(smartphones.slug, "smartphones")
+        self.assertEqual(
+            [c.name for c in smartphones.get_ancestors()], ["Electronics", "Phones"]
+        )
+        # Nodes inserted with ``save`` land in the same place.
+        Category.objects.create(name="Drama", parent=Category.objects.get(name="Books"))
+        self.assertMatchesRebuild()
+
+    def test_resync_is_idempotent(self):
+        Category.objects.sync_tree(self.taxonomy)
+        before = self.numbering()
+
+        result = Category.objects.sync_tree(self.taxonomy)
+
+        self.assertEqual((result.created, result.updated, result.deleted), (0, 0, 0))
+        self.assertEqual(self.numbering(), before)
+
+    def test_resync_adds_and_renumbers(self):
+        Category.objects.sync_tree(self.taxonomy)
+        phones = Category.objects.get(name="Phones")
+
+        taxonomy = dict(self.taxonomy, Art=["Painting"])
+        taxonomy["Electronics"] = dict(taxonomy["Electronics"], Cameras=["Lenses"])
+        # Load, slug check, one insert per new level and one update per shift;
+        # nothing per node.
+        with self.assertNumQueries(10):
+            result = Category.objects.sync_tree(taxonomy)
+
+        self.assertEqual(result.created, 4)
+        self.assertGreater(result.updated, 0)
+        self.assertEqual(Category.objects.get(name="Phones").pk, phones.pk)
+        self.assertMatchesRebuild()
+
+    def test_prune(self):
+        Category.objects.sync_tree(self.taxonomy)
+        user = User.objects.create_user(username="owner", password="password")
+        product = Product.objects.create(
+            name="Phone",
+            description="A phone",
+            price=10,
+            in_stock=1,
+            category=Category.objects.get(name="Smartphones"),
+            added_by=user,
+        )
+
+        taxonomy = {"Electronics": {"Laptops": []}, "Books": ["Poetry", "Fiction"]}
+        result = Category.objects.sync_tree(taxonomy, prune=True)
+
+        self.assertEqual(result.deleted, 3)
+        self.assertFalse(Category.objects.filter(name="Phones").exists())
+        product.refresh_from_db()
+        self.assertIsNone(product.category)
+        self.assertMatchesRebuild()
+
+    def test_command(self):
+        out = StringIO()
+        call_command("add_categories", stdout=out)
+        count = Category.objects.count()
+        self.assertGreater(count, 0)
+        self.assertMatchesRebuild()
+
+        call_command("add_categories", stdout=out)
+        self.assertEqual(Category.objects.count(), count)
+        self.assertIn("0 created", out.getvalue())
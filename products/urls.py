@@ -1,17 +1,30 @@
 from django.urls import path
 from .views import (
     ProductListCreateView,
+    ProductExportView,
+    ProductBatchView,
     ProductRetrieveUpdateDestroyView,
     ProductImageUpdateDestroyView,
     ProductReviewListCreateView,
     ProductReviewUpdateDestroyView,
     CategoriesListView,
     CategoryRetrieveView,
+    CategoryTreeView,
+)
+from .async_views import (
+    AsyncProductListView,
+    AsyncProductDetailView,
+    AsyncProductReviewListView,
+    AsyncCategoryListView,
+    AsyncCategoryRetrieveView,
+    AsyncCategoryTreeView,
 )
 
 
 urlpatterns = [
     path("products/", ProductListCreateView.as_view(), name="product-list-create"),
+    path("products/export/", ProductExportView.as_view(), name="product-export"),
+    path("products/batch/", ProductBatchView.as_view(), name="product-batch"),
     path(
         "products/<int:pk>/",
         ProductRetrieveUpdateDestroyView.as_view(),
@@ -33,7 +46,33 @@ urlpatterns = [
         name="product-review-update-destroy",
     ),
     path("categories/", CategoriesListView.as_view(), name="categories-list"),
+    path("categories/tree/", CategoryTreeView.as_view(), name="category-tree"),
     path(
         "categories/<int:pk>/", CategoryRetrieveView.as_view(), name="category-retrieve"
     ),
+    # Async read-only variants, for ASGI workers.
+    path("async/products/", AsyncProductListView.as_view(), name="async-product-list"),
+    path(
+        "async/products/<int:pk>/",
+        AsyncProductDetailView.as_view(),
+        name="async-product-detail",
+    ),
+    path(
+        "async/products/<int:pk>/reviews/",
+        AsyncProductReviewListView.as_view(),
+        name="async-product-review-list",
+    ),
+    path(
+        "async/categories/", AsyncCategoryListView.as_view(), name="async-categories-list"
+    ),
+    path(
+        "async/categories/tree/",
+        AsyncCategoryTreeView.as_view(),
+        name="async-category-tree",
+    ),
+    path(
+        "async/categories/<int:pk>/",
+        AsyncCategoryRetrieveView.as_view(),
+        name="async-category-retrieve",
+    ),
 ]
@@ -1,4 +1,5 @@
 import re
+from django.db import IntegrityError, transaction
 from django.template.defaultfilters import slugify
 
 
@@ -12,38 +13,117 @@ def unique_slugify(instance, slug_field_name="slug", queryset=None, slug_separat
     ``queryset`` usually doesn't need to be explicitly provided - it'll default
     to using the ``.all()`` queryset from the model's default manager.
     """
-    slug_field = instance._meta.get_field(slug_field_name)
+    allocate_slugs([instance], slug_field_name, queryset, slug_separator)
 
-    slug = getattr(instance, slug_field.attname)
-    slug_len = slug_field.max_length
 
-    # Sort out the initial slug, limiting its length if necessary.
-    slug = slugify(instance.name)
-    if slug_len:
-        slug = slug[:slug_len]
-    slug = _slug_strip(slug, slug_separator)
-    original_slug = slug
+def allocate_slugs(
+    instances, slug_field_name="slug", queryset=None, slug_separator="-"
+):
+    """
+    Calculates and stores unique slugs for a batch of instances of one model.
+
+    Existing ``slug`` / ``slug-N`` values are fetched with one prefix query per
+    distinct base slug that is already taken, and the next free suffix is
+    picked in memory, so a whole batch costs a handful of queries and its slugs
+    are unique among themselves as well. Returns the allocated slugs in order.
+    """
+    instances = list(instances)
+    if not instances:
+        return []
+
+    model = instances[0].__class__
+    slug_field = model._meta.get_field(slug_field_name)
+    slug_len = slug_field.max_length
 
     # Create the queryset if one wasn't explicitly provided and exclude the
-    # current instance from the queryset.
+    # instances themselves from it.
     if queryset is None:
-        queryset = instance.__class__._default_manager.all()
-    if instance.pk:
-        queryset = queryset.exclude(pk=instance.pk)
-
-    # Find a unique slug. If one matches, at '-2' to the end and try again
-    # (then '-3', etc).
-    next = 2
-    while not slug or queryset.filter(**{slug_field_name: slug}):
-        slug = original_slug
-        end = "%s%s" % (slug_separator, next)
-        if slug_len and len(slug) + len(end) > slug_len:
-            slug = slug[: slug_len - len(end)]
-            slug = _slug_strip(slug, slug_separator)
-        slug = "%s%s" % (slug, end)
-        next += 1
-
-    setattr(instance, slug_field.attname, slug)
+        queryset = model._default_manager.all()
+    pks = [instance.pk for instance in instances if instance.pk]
+    if pks:
+        queryset = queryset.exclude(pk__in=pks)
+
+    def base_slug(instance):
+        # Sort out the initial slug, limiting its length if necessary.
+        slug = slugify(instance.name)
+        if slug_len:
+            slug = slug[:slug_len]
+        return _slug_strip(slug, slug_separator)
+
+    bases = [base_slug(instance) for instance in instances]
+    # Most names are new: one exact lookup settles all of them, and only the
+    # bases already in use need a prefix query for their suffixes.
+    in_use = set(
+        queryset.filter(**{f"{slug_field_name}__in": set(bases)}).values_list(
+            slug_field_name, flat=True
+        )
+    )
+    existing = {}
+    reserved = set()
+    next_suffix = {}
+
+    def taken(stem, slug):
+        if stem == slug and slug not in in_use:
+            return slug in reserved
+        if stem not in existing:
+            pattern = r"^%s(%s[0-9]+)?$" % (re.escape(stem), re.escape(slug_separator))
+            existing[stem] = set(
+                queryset.filter(
+                    **{
+                        f"{slug_field_name}__startswith": stem,
+                        f"{slug_field_name}__regex": pattern,
+                    }
+                ).values_list(slug_field_name, flat=True)
+            )
+        return slug in existing[stem] or slug in reserved
+
+    slugs = []
+    for instance, slug in zip(instances, bases):
+        original_slug = stem = slug
+
+        # If the slug is taken, add '-2' to the end and try again (then '-3',
+        # etc), resuming where the previous instance with this slug stopped.
+        next = next_suffix.get(original_slug, 2)
+        while not slug or taken(stem, slug):
+            end = "%s%s" % (slug_separator, next)
+            stem = original_slug
+            if slug_len and len(stem) + len(end) > slug_len:
+                stem = stem[: slug_len - len(end)]
+                stem = _slug_strip(stem, slug_separator)
+            slug = "%s%s" % (stem, end)
+            next += 1
+        next_suffix[original_slug] = next
+
+        reserved.add(slug)
+        setattr(instance, slug_field.attname, slug)
+        slugs.append(slug)
+
+    return slugs
+
+
+def save_with_unique_slug(instance, save, *args, slug_field_name="slug", attempts=3, **kwargs):
+    """
+    Inserts ``instance`` through ``save``, retrying when a concurrent insert
+    wins the race for the same slug.
+
+    The slug is allocated again on each attempt by the model's ``pre_save``
+    receiver; the failed insert is rolled back to a savepoint first.
+    """
+    if not instance._state.adding:
+        return save(*args, **kwargs)
+
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            slug = getattr(instance, slug_field_name)
+            lost_race = instance.__class__._default_manager.filter(
+                **{slug_field_name: slug}
+            ).exists()
+            if not lost_race or attempt == attempts - 1:
+                raise
+            instance.pk = None
 
 
 def _slug_strip(value, separator="-"):
@@ -1,30 +1,62 @@
 from rest_framework import generics, filters, permissions
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.http import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.core.files.storage import default_storage
 from .models import Product, ProductImage, ProductReview, Category
 from .serializers import (
     ProductSerializer,
+    ProductListSerializer,
     ProductImageSerializer,
     ProductReviewSerializer,
     CategorySerializer,
 )
 
 from common.permissions import IsManager
+from common.views import SparseFieldsQuerySetMixin
 from .permissions import IsManagerAndProductOwner, IsManagerOrReadOnly
-from .filters import ProductFilter
-from .paginations import ProductPagination
+from .filters import (
+    ProductFilter,
+    ProductOrderingFilter,
+    ProductReviewFilter,
+    ProductSearchFilter,
+)
+from .paginations import (
+    ProductCursorPagination,
+    ProductPagination,
+    ReviewCursorPagination,
+)
+from .cache import CachedResponseMixin
+from .conditional import (
+    CatalogVersionConditionalMixin,
+    CategoryTreeConditionalMixin,
+    ConditionalGetMixin,
+)
+from .ratings import SUMMARY_FIELDS, apply_rating_change, rating_summary
+from .cards import get_cards, with_absolute_urls
+from .categories import get_category_tree
+from .facets import get_facets, requested_facets
+from .exports import ENCODERS, export_queryset, iter_records, parse_updated_since
+from .renderers import CSVRenderer, NDJSONRenderer
 
 
 class ProductQuerySetMixin:
     def get_queryset(self):
         return (
-            Product.objects.select_related("added_by", "category")
-            .prefetch_related("images")
-            .order_by("-created_at")
+            Product.objects.prefetch_related("images__variants").order_by("-created_at")
         )
 
 
-class ProductListCreateView(ProductQuerySetMixin, generics.ListCreateAPIView):
+class ProductListCreateView(
+    CatalogVersionConditionalMixin,
+    CachedResponseMixin,
+    ProductQuerySetMixin,
+    generics.ListCreateAPIView,
+):
     """
     List all products or create a new product.
 
@@ -35,21 +67,52 @@ class ProductListCreateView(ProductQuerySetMixin, generics.ListCreateAPIView):
     serializer_class = ProductSerializer
     filter_backends = [
         DjangoFilterBackend,
-        filters.OrderingFilter,
-        filters.SearchFilter,
+        ProductOrderingFilter,
+        ProductSearchFilter,
     ]
     filterset_class = ProductFilter
-    ordering_fields = ["price"]
-    search_fields = ["name", "description"]
+    ordering_fields = ["price", "rating"]
     pagination_class = ProductPagination
     permission_classes = [IsManagerOrReadOnly]
 
+    def get_queryset(self):
+        if self.request.method != "GET":
+            return super().get_queryset()
+        # Cards are rendered from the card cache, which loads its own misses,
+        # so the page itself only needs the ids and the cursor position.
+        return Product.objects.only(*ProductCursorPagination.cursor_fields).order_by(
+            "-created_at"
+        )
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return ProductListSerializer
+        return ProductSerializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        self.filtered_queryset = queryset
+        return queryset
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        facets = requested_facets(self.request)
+        if facets:
+            response.data["facets"] = get_facets(
+                self.filtered_queryset, self.request, facets
+            )
+        return response
+
     def perform_create(self, serializer):
         serializer.save(added_by=self.request.user)
 
 
 class ProductRetrieveUpdateDestroyView(
-    ProductQuerySetMixin, generics.RetrieveUpdateDestroyAPIView
+    ConditionalGetMixin,
+    CachedResponseMixin,
+    SparseFieldsQuerySetMixin,
+    ProductQuerySetMixin,
+    generics.RetrieveUpdateDestroyAPIView,
 ):
     """
     Retrieve, update or delete a product.
@@ -66,6 +129,112 @@ class ProductRetrieveUpdateDestroyView(
             return (permissions.AllowAny(),)
         return (IsManagerAndProductOwner(),)
 
+    def get_validator(self, request, *args, **kwargs):
+        updated_at = (
+            Product.objects.filter(pk=kwargs["pk"])
+            .values_list("updated_at", flat=True)
+            .first()
+        )
+        if updated_at is None:
+            return None
+        return updated_at.isoformat(), updated_at
+
+
+class ProductExportView(APIView):
+    """
+    Stream the catalog as NDJSON (default) or CSV (``?format=csv``).
+
+    ``updated_since`` (ISO date or datetime) limits the export to products
+    changed since then, for incremental pulls.
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+    chunk_size = 2000
+
+    def get_updated_since(self):
+        try:
+            return parse_updated_since(self.request.query_params.get("updated_since"))
+        except ValueError as exc:
+            raise ValidationError({"updated_since": str(exc)})
+
+    def get_image_url(self, name):
+        return self.request.build_absolute_uri(default_storage.url(name))
+
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        records = iter_records(
+            export_queryset(self.get_updated_since()),
+            chunk_size=self.chunk_size,
+            image_url=self.get_image_url,
+        )
+        response = StreamingHttpResponse(
+            ENCODERS[renderer.format](records), content_type=renderer.media_type
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="products.{renderer.format}"'
+        )
+        return response
+
+
+class ProductBatchView(CatalogVersionConditionalMixin, APIView):
+    """
+    Product cards for up to ``max_batch_size`` products in one request.
+
+    GET: ``?ids=1,2,3`` or ``?slugs=a,b``. Cards come back in the requested
+    order and ids or slugs that don't exist are listed under ``missing``.
+    """
+
+    permission_classes = (permissions.AllowAny,)
+    max_batch_size = 50
+
+    def get_keys(self):
+        params = self.request.query_params
+        if ("ids" in params) == ("slugs" in params):
+            raise ValidationError("Pass either ids or slugs.")
+
+        lookup = "ids" if "ids" in params else "slugs"
+        keys = []
+        for value in params.getlist(lookup):
+            keys += [key.strip() for key in value.split(",") if key.strip()]
+        keys = list(dict.fromkeys(keys))
+
+        if len(keys) > self.max_batch_size:
+            raise ValidationError(
+                {lookup: f"At most {self.max_batch_size} products per request."}
+            )
+        if lookup == "ids":
+            try:
+                keys = list(dict.fromkeys(int(key) for key in keys))
+            except ValueError:
+                raise ValidationError({"ids": "Ids must be integers."})
+        return lookup, keys
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.render_batch)
+
+    def render_batch(self):
+        lookup, keys = self.get_keys()
+        if lookup == "ids":
+            ids = dict(zip(keys, keys))
+        else:
+            ids = dict(
+                Product.objects.filter(slug__in=keys).values_list("slug", "pk")
+            )
+
+        cards = get_cards(ids.values())
+        names = ProductListSerializer.get_sparse_field_names(self.request)
+        results, missing = [], []
+        for key in keys:
+            card = cards.get(ids.get(key))
+            if card is None:
+                missing.append(key)
+                continue
+            if names is not None:
+                card = {name: card[name] for name in names}
+            results.append(with_absolute_urls(card, self.request))
+        return Response({"results": results, "missing": missing})
+
 
 class ProductImageUpdateDestroyView(generics.UpdateAPIView, generics.DestroyAPIView):
     """
@@ -94,18 +263,35 @@ class ProductReviewListCreateView(generics.ListCreateAPIView):
 
     serializer_class = ProductReviewSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_class = ProductReviewFilter
+    ordering_fields = ["created_at", "rating"]
+    pagination_class = ReviewCursorPagination
 
     def get_product_or_404(self, pk):
         return get_object_or_404(Product, pk=pk)
 
     def get_queryset(self):
-        return ProductReview.objects.filter(
-            product__pk=self.kwargs["pk"]
-        ).select_related("user")
+        return (
+            ProductReview.objects.filter(product_id=self.kwargs["pk"])
+            .select_related("user")
+            .order_by("-created_at")
+        )
+
+    def get_paginated_response(self, data):
+        # The histogram comes from the product's counters, not the reviews.
+        product = get_object_or_404(
+            Product.objects.only(*SUMMARY_FIELDS), pk=self.kwargs["pk"]
+        )
+        response = super().get_paginated_response(data)
+        response.data["summary"] = rating_summary(product)
+        return response
 
+    @transaction.atomic
     def perform_create(self, serializer):
         product = self.get_product_or_404(self.kwargs["pk"])
-        serializer.save(user=self.request.user, product=product)
+        review = serializer.save(user=self.request.user, product=product)
+        apply_rating_change(product.pk, added=review.rating)
 
 
 class ProductReviewUpdateDestroyView(generics.UpdateAPIView, generics.DestroyAPIView):
@@ -120,12 +306,38 @@ class ProductReviewUpdateDestroyView(generics.UpdateAPIView, generics.DestroyAPI
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_queryset(self):
-        return ProductReview.objects.filter(
-            product__pk=self.kwargs["pk"], user=self.request.user
-        ).select_related("user")
+        queryset = ProductReview.objects.filter(user=self.request.user).select_related(
+            "user"
+        )
+        if self.request.method not in permissions.SAFE_METHODS:
+            # Concurrent edits of one review queue up here, so each one reads
+            # the rating the previous one left behind.
+            queryset = queryset.select_for_update(of=("self",))
+        return queryset
+
+    @transaction.atomic
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @transaction.atomic
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        previous_rating = serializer.instance.rating
+        review = serializer.save()
+        apply_rating_change(
+            review.product_id, added=review.rating, removed=previous_rating
+        )
+
+    def perform_destroy(self, instance):
+        apply_rating_change(instance.product_id, removed=instance.rating)
+        instance.delete()
 
 
-class CategoriesListView(generics.ListAPIView):
+class CategoriesListView(
+    CategoryTreeConditionalMixin, CachedResponseMixin, generics.ListAPIView
+):
     """
     List all categories and subcategories
     """
@@ -138,7 +350,7 @@ class CategoriesListView(generics.ListAPIView):
         return Category.objects.prefetch_related("children").filter(parent=None)
 
 
-class CategoryRetrieveView(generics.RetrieveAPIView):
+class CategoryRetrieveView(CategoryTreeConditionalMixin, generics.RetrieveAPIView):
     """
     Retrieve a specific category and its subcategories
     """
@@ -146,6 +358,38 @@ class CategoryRetrieveView(generics.RetrieveAPIView):
     serializer_class = CategorySerializer
     permission_classes = (permissions.AllowAny,)
 
-    def get_queryset(self):
-        pk = self.kwargs["pk"]
-        return Category.objects.filter(pk=pk)
+    def retrieve(self, request, *args, **kwargs):
+        node = get_category_tree().get_node(self.kwargs["pk"])
+        if node is None:
+            raise NotFound()
+
+        return Response(
+            {
+                "id": node["id"],
+                "name": node["name"],
+                "slug": node["slug"],
+                "subcategories": [
+                    {"id": child["id"], "name": child["name"], "slug": child["slug"]}
+                    for child in node["subcategories"]
+                ],
+            }
+        )
+
+
+class CategoryTreeView(CategoryTreeConditionalMixin, APIView):
+    """
+    The whole category tree, at full depth.
+
+    Served from the per-worker tree snapshot, which is rebuilt only after a
+    category write.
+    """
+
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            lambda: HttpResponse(
+                get_category_tree().tree_json, content_type="application/json"
+            ),
+        )